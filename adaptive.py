@@ -0,0 +1,282 @@
+"""
+    Adaptive time stepping for the vectorized network
+    AdaptiveStepper(net) - advances the whole network by several dt at once while the dynamics are slow
+    timingError()        - compares the spike times of an adaptive run with a fixed dt run
+
+    Spikes still happen on the dt grid: a long step is only taken if no neuron is predicted to reach the spike
+    cut off within it, the input currents hardly change over it (no spike onsets arriving), and it moves no
+    predicted spike by more than its share of tolT ms (see AdaptiveStepper).  Otherwise the network takes a normal
+    dt step, and after failed attempts it waits longer and longer before trying again, so a network that keeps
+    spiking costs little more than a fixed dt run.  Long steps are forward Euler steps, like dt steps; the
+    correction a Heun (second order) step would make is their error estimate.  State recordings keep one sample per
+    dt step: the samples inside a long step are interpolated linearly (see Population.setState).
+"""
+
+import random
+import numpy as np
+
+_VPEAK = 30     # spike cut off of the integrator (see backend.py)
+_MINSKIP = 4    # shortest long step, in multiples of dt (a trial costs about as much as two dt steps)
+_MAXWAIT = 64   # longest wait between attempts, in dt steps
+
+
+class AdaptiveStepper(object):
+    """
+        Chooses and takes long steps (k * dt, k a power of 2) for a Network
+
+        Fields:
+        net         - the (vectorized) Network
+        tolT        - largest spike timing error (in ms) the long steps may add up to over a phase: every step may
+                      move the predicted spike time (see _crossing) of every neuron by its share of tolT, in proportion
+                      to its length
+        tolI        - largest accepted change of any input current over a long step
+        maxSkip     - longest step, in multiples of dt
+        k           - length of the last accepted step (the next attempt is up to twice as long)
+        wait        - dt steps left to take before the next attempt
+        backoff     - dt steps to wait after the next failed attempt (doubles with every failure in a row, up to
+                      _MAXWAIT)
+        stats       - dictionary counting
+                        steps        - steps taken (long and dt steps)
+                        longSteps    - long steps taken
+                        baseSteps    - dt steps covered (what a fixed dt run takes)
+                        saved        - baseSteps - steps
+                        integrations - model evaluations, one per layer for a dt step and for every long step trial
+                                       (rejected ones included) one at the start plus one per step length tried
+                        currents     - input current computations of every layer for the trials (a dt step makes
+                                       its own, as in a fixed dt run)
+    """
+    def __init__(self, net, tolT : float = 0.05, tolI : float = 0.2, maxSkip : int = 16):
+        if not net.vectorized:
+            raise ValueError('Adaptive stepping needs the vectorized network')
+        if net.kernel != 'table':
+            raise ValueError('Adaptive stepping needs the table spike shape')
+
+        self.net        = net
+        self.tolT       = tolT
+        self.tolI       = tolI
+        self.maxSkip    = maxSkip
+        self.k          = 1
+        self.wait       = 0
+        self.backoff    = 1
+        self.stats      = dict()
+
+        self.reset()
+
+    def options(self) -> dict:
+        """
+            Keyword arguments that rebuild this stepper on another network (e.g. in an evaluate worker)
+        """
+        return {'tolT' : self.tolT, 'tolI' : self.tolI, 'maxSkip' : self.maxSkip}
+
+    def reset(self):
+        """
+            Clears the statistics
+        """
+        self.k = 1
+        self.wait = 0
+        self.backoff = 1
+        self.stats = {'steps' : 0, 'longSteps' : 0, 'baseSteps' : 0, 'saved' : 0, 'integrations' : 0, 'currents' : 0}
+
+    def _count(self, steps : int, long : bool):
+        self.stats['steps'] += 1
+        self.stats['baseSteps'] += steps
+        self.stats['saved'] = self.stats['baseSteps'] - self.stats['steps']
+        if long:
+            self.stats['longSteps'] += 1
+
+    def _dtStep(self) -> int:
+        """
+            Leaves the step to the network (a normal dt step)
+        """
+        self.k = 1
+        self._count(1, long=False)
+        self.stats['integrations'] += len(self.net.populations)
+        return 0
+
+    def _power2(self, k : float) -> int:
+        """
+            Largest power of 2 up to k and maxSkip (0 if k < 1)
+        """
+        k = int(min(k, self.maxSkip))
+        return 1 << (k.bit_length() - 1) if k >= 1 else 0
+
+    def _currents(self, simStep : int, I_in, I_pain) -> list:
+        """
+            Saturated input current of every layer at simStep, from the spikes that have already happened
+        """
+        acts = dict()
+        self.stats['currents'] += len(self.net.populations)
+        return [np.clip(self.net._layerCurrent(pop, simStep, I_in, I_pain, acts), 0, pop.maxI)
+                for pop in self.net.populations]
+
+    def _derivatives(self, pop, v : np.ndarray, u : np.ndarray, I : np.ndarray) -> tuple:
+        """
+            Izhikevich model derivatives (dv/dt, du/dt) of a layer in state (v, u) with input I
+        """
+        self.stats['integrations'] += 1
+        return 0.04 * (v * v) + 5 * v + 140 - u + I, pop.a * (pop.b * v - u)
+
+    @staticmethod
+    def _crossing(v : np.ndarray, u : np.ndarray, I : np.ndarray) -> np.ndarray:
+        """
+            Time (in ms) each neuron takes to reach the spike cut off with u and I held, from
+            dv/dt = 0.04 ((v + 62.5)^2 + q); inf for the neurons below the unstable fixed point (they do not spike
+            unless their input grows).  u only grows on the way up, so the actual crossing comes later.
+        """
+        q = (140 - u + I) / 0.04 - 62.5 ** 2
+        x = v + 62.5
+        X = _VPEAK + 62.5
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = np.sqrt(np.abs(q))
+            # no fixed point: always heading for a spike
+            free = (np.arctan(X / r) - np.arctan(x / r)) / (0.04 * r)
+            # fixed points at -62.5 -+ r: spiking only above the unstable one
+            bound = np.where(x > r, np.log((X - r) * (x + r) / ((X + r) * (x - r))) / (0.08 * r), np.inf)
+            t = np.where(q > 0, free, bound)
+
+        return np.where(np.isnan(t), np.inf, t)
+
+    def _trial(self, start : list, Iend : list, k : int, horizon : float) -> tuple:
+        """
+            Forward Euler step of every layer over k * dt, with the Heun step's correction as error estimate
+            Inputs:
+                start   - (dv/dt, du/dt, crossing time) per layer at the start of the step
+                Iend    - input current per layer at the end of the step
+                horizon - time (in ms) left in the phase
+            Outputs:
+                (states, error) - list of (v, u, I) per layer at the end of the step (None if the step is rejected),
+                                  and the largest timing error over what the step may add (> 1 = rejected)
+        """
+        h = k * self.net.dt
+        states = list()
+        error = 0
+        for pop, (dv, du, crossing), I in zip(self.net.populations, start, Iend):
+            I = np.broadcast_to(I, pop.v.shape)
+            v = pop.v + h * dv
+            u = pop.u + h * du
+            if np.any(v >= _VPEAK):
+                return None, np.inf
+            dvEnd, duEnd = self._derivatives(pop, v, u, I)
+
+            # Heun's correction of the state moves the predicted spike: that is the timing error the step makes.
+            # These shifts add up over the phase, so a step may only add its share of tolT: h over the time left in
+            # the phase (the predicted spike, with u held, comes too early to budget by: the actual one is later and
+            # the shifts keep adding up until it).  Neurons that are not heading for a spike only drift off their
+            # trajectory, by the correction of v over the speed v moves at (at least 1 mV/ms)
+            ev = h / 2 * (dvEnd - dv)
+            eu = h / 2 * (duEnd - du)
+            with np.errstate(invalid='ignore'):
+                moved = np.abs(self._crossing(v + ev, u + eu, I) - self._crossing(v, u, I))
+            shift = np.where(np.isfinite(crossing), moved, np.abs(ev) / np.maximum(np.abs(dvEnd), 1))
+            shift = np.where(np.isnan(shift), np.inf, shift)
+            share = self.tolT * h / horizon
+            error = max(error, np.max(shift / share, initial=0))
+            if error > 1:
+                return None, error
+            states.append((v, u, I))
+
+        return states, error
+
+    def advance(self, I_in, I_pain, end : int = None) -> int:
+        """
+            Tries to take one long step from net.simStep, not going past the time index end (None = end of the phase)
+            Outputs:
+                number of dt steps advanced (0 = take a normal dt step now)
+        """
+        net = self.net
+        remaining = (len(net.t) if end is None else end) - net.simStep
+        k = min(max(2 * self.k, _MINSKIP), self.maxSkip, remaining)
+        if k < _MINSKIP or self.wait > 0:
+            self.wait = max(self.wait - 1, 0)
+            return self._dtStep()
+
+        I = self._currents(net.simStep, I_in, I_pain)
+        start = list()
+        for pop, Ilayer in zip(net.populations, I):
+            dv, du = self._derivatives(pop, pop.v, pop.u, Ilayer)
+            crossing = self._crossing(pop.v, pop.u, Ilayer)
+            start.append((dv, du, crossing))
+            # refine well before a predicted spike
+            k = min(k, self._power2(np.min(crossing, initial=np.inf) / 2 / net.dt))
+
+        while k >= _MINSKIP:
+            # the input must stay (nearly) constant over the step, i.e. no spike onsets arriving
+            Iend = self._currents(net.simStep + k, I_in, I_pain)
+            if all(np.max(np.abs(a - b), initial=0) <= self.tolI for a, b in zip(I, Iend)):
+                states, error = self._trial(start, Iend, k, remaining * net.dt)
+                if states is not None:
+                    for pop, (v, u, Iend), Istart in zip(net.populations, states, I):
+                        pop.setState(v, u, net.simStep + k, Iend, start=net.simStep, Istart=Istart)
+                    self.k = k
+                    self.backoff = 1
+                    self._count(k, long=True)
+                    return k
+                # the shift of an Euler step grows with the square of its length, its share with the length:
+                # go straight to a length that may pass
+                k = min(k // 2, self._power2(k / error))
+            else:
+                k = k // 2
+
+        # dt steps for a while: the dynamics are fast (or inputs arriving)
+        self.wait = self.backoff - 1
+        self.backoff = min(2 * self.backoff, _MAXWAIT)
+        return self._dtStep()
+
+
+def timingError(structure : list = [4, 1, 3, 5], phaseDuration : int = 100, dt : float = 0.01, seed : int = 41,
+                I_in : list = None, I_pain : float = 0, **kwargs) -> dict:
+    """
+        Runs the same network with fixed dt and with adaptive steps (keyword arguments go to AdaptiveStepper)
+        Outputs:
+            dictionary with
+                maxError         - largest difference (in ms) between matching spike times (inf if the spike counts
+                                   differ)
+                steps            - steps taken by the adaptive run
+                baseSteps        - steps taken by the fixed dt run
+                saved            - steps saved by the adaptive run
+                integrations     - model evaluations of the adaptive run, rejected trials included (see
+                                   AdaptiveStepper.stats)
+                baseIntegrations - model evaluations of the fixed dt run (one per layer and step)
+                currents         - extra input current computations of the adaptive run, per layer
+    """
+    from network import Network
+
+    if I_in is None:
+        I_in = [20 + 10 * i for i in range(structure[0])]
+
+    spikes = list()
+    for adaptive in [False, True]:
+        random.seed(seed)
+        net = Network(phaseDuration=phaseDuration, dt=dt, structure=structure, recordSpikes=True, recordState=(),
+                      adaptive=adaptive)
+        if adaptive:
+            net.adaptive = AdaptiveStepper(net, **kwargs)
+        net.step(I_in=I_in, I_pain=I_pain)
+        spikes.append([neu.spikeHistory for layer in net.neurons for neu in layer])
+
+    maxError = 0
+    for fixed, adapt in zip(*spikes):
+        if len(fixed) != len(adapt):
+            maxError = np.inf
+            break
+        if len(fixed) > 0:
+            maxError = max(maxError, np.max(np.abs(np.array(fixed) - np.array(adapt))) * dt)
+
+    stats = net.adaptive.stats
+    return {'maxError'         : float(maxError),
+            'steps'            : stats['steps'],
+            'baseSteps'        : stats['baseSteps'],
+            'saved'            : stats['saved'],
+            'integrations'     : stats['integrations'],
+            'baseIntegrations' : stats['baseSteps'] * len(net.populations),
+            'currents'         : stats['currents']
+            }
+
+
+if __name__ == '__main__':
+    for I_in in [[0, 0, 0, 0], [0, 0, 0, 30], [20, 30, 40, 50]]:
+        for tolT in [0.05, 0.2]:
+            result = timingError(I_in=I_in, tolT=tolT)
+            print(f"I_in = {I_in}, tolT = {tolT} ms: {result['integrations']} integrations instead of "
+                  f"{result['baseIntegrations']} ({result['steps']} steps instead of {result['baseSteps']}, "
+                  f"{result['currents']} extra currents), spike times within {result['maxError']:.3f} ms")
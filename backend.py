@@ -0,0 +1,252 @@
+"""
+    Simulation backends for the Population engine
+    Each backend supplies the three hot kernels of a step: the Izhikevich integrator, the presynaptic activation
+    (spike shape lookup) and the synaptic current (weights times activations).
+
+    ReferenceBackend - pure Python loops, the same arithmetic as Neuron.step and Synapse.step
+    NumpyBackend     - vectorized NumPy (default)
+    NumbaBackend     - JIT compiled loops, only available when Numba is installed
+
+    getBackend(name)  - backend object for 'reference', 'numpy', 'numba' or 'auto' (numba if installed, else numpy)
+    crossCheck()      - runs a network on every available backend and compares the spike times with the reference
+"""
+
+from math import pow
+import random
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+class NumpyBackend(object):
+    """
+        Vectorized NumPy kernels.  All state arrays may carry a leading batch axis.
+    """
+    name = 'numpy'
+
+    def integrate(self, v : np.ndarray, u : np.ndarray, a : np.ndarray, b : np.ndarray, c : np.ndarray,
+                  d : np.ndarray, I : np.ndarray, dt : float) -> tuple:
+        """
+            One forward Euler step of the Izhikevich model, including the reset
+            Inputs:
+                v, u        - membrane potential and recovery arrays
+                a, b, c, d  - parameter arrays, one entry per neuron
+                I           - input current (already saturated to [0, maxI]), same shape as v
+                dt          - time step (in ms)
+            Outputs:
+                (v, u, fired) - new state and boolean array of the neurons that spiked
+        """
+        vnow = v # current membrane potential
+        dv = (0.04 * (vnow * vnow) + 5 * vnow + 140 - u + I) * dt
+        du = (a * (b * vnow - u)) * dt
+
+        # Adjust the variables
+        v = vnow + dv
+        u = u + du
+
+        # Reset if needed
+        fired = v >= 30
+        if fired.any():
+            v = np.where(fired, c, v)
+            u = np.where(fired, u + d, u)
+
+        return v, u, fired
+
+    def activation(self, recentSpikes : np.ndarray, simStep : int, ispike : np.ndarray) -> np.ndarray:
+        """
+            Strongest spike shape value of each neuron's recent spikes (Population.recentSpikes ring buffer)
+        """
+        ages = simStep - recentSpikes
+        inFlight = (ages >= 0) & (ages < len(ispike))
+
+        # Possible overlapping spikes
+        # Find whichever current value in spike is strongest
+        vals = np.where(inFlight, ispike[np.clip(ages, 0, len(ispike) - 1)], 0)
+
+        return vals.max(axis=-1)
+
+    def current(self, act : np.ndarray, W : np.ndarray) -> np.ndarray:
+        """
+            Weighted current into each postsynaptic neuron, W is (post, pre)
+        """
+        return act @ W.T
+
+
+class ReferenceBackend(NumpyBackend):
+    """
+        Pure Python loops over the neurons, doing exactly what Neuron.step / Synapse.step / Neuron._calcI do.
+        Slow; it is the yardstick the other backends are checked against.
+    """
+    name = 'reference'
+
+    def integrate(self, v, u, a, b, c, d, I, dt) -> tuple:
+        v = v.copy()
+        u = u.copy()
+        fired = np.zeros(v.shape, dtype=bool)
+
+        for idx in np.ndindex(v.shape):
+            i = idx[-1]
+            vnow = float(v[idx]) # current membrane potential
+            unow = float(u[idx])
+            dv = (0.04 * pow(vnow,2) + 5 * vnow + 140 - unow + float(I[idx])) * dt
+            du = (float(a[i]) * (float(b[i])*vnow - unow)) * dt
+
+            # Adjust the variables
+            v[idx] = vnow + dv
+            u[idx] = unow + du
+
+            # Reset if needed
+            if v[idx] >= 30:
+                v[idx] = c[i]
+                u[idx] = u[idx] + d[i]
+                fired[idx] = True
+
+        return v, u, fired
+
+    def activation(self, recentSpikes, simStep, ispike) -> np.ndarray:
+        act = np.zeros(recentSpikes.shape[:-1])
+
+        for idx in np.ndindex(act.shape):
+            synI = 0
+            for spike in recentSpikes[idx]:
+                if 0 <= simStep - spike < len(ispike):
+                    # Possible overlapping spikes
+                    # Find whichever current value in spike is strongest
+                    if ispike[int(simStep-spike)] > synI:
+                        synI = ispike[int(simStep-spike)]
+            act[idx] = synI
+
+        return act
+
+    def current(self, act, W) -> np.ndarray:
+        act = np.asarray(act)
+        I = np.zeros(act.shape[:-1] + (W.shape[0],))
+
+        for idx in np.ndindex(act.shape[:-1]):
+            for j in range(W.shape[0]):
+                totalI = 0
+                for i in range(W.shape[1]):
+                    totalI = totalI + W[j, i] * act[idx + (i,)]
+                I[idx + (j,)] = totalI
+
+        return I
+
+
+if numba is not None:
+    @numba.njit(cache=True)
+    def _integrateJit(v, u, a, b, c, d, I, dt, fired):
+        # v, u, I, fired are (rows, neurons); updated in place
+        for r in range(v.shape[0]):
+            for i in range(v.shape[1]):
+                vnow = v[r, i]
+                unow = u[r, i]
+                dv = (0.04 * (vnow * vnow) + 5 * vnow + 140 - unow + I[r, i]) * dt
+                du = (a[i] * (b[i] * vnow - unow)) * dt
+                vnew = vnow + dv
+                unew = unow + du
+                if vnew >= 30:
+                    vnew = c[i]
+                    unew = unew + d[i]
+                    fired[r, i] = True
+                else:
+                    fired[r, i] = False
+                v[r, i] = vnew
+                u[r, i] = unew
+
+    @numba.njit(cache=True)
+    def _activationJit(ring, simStep, ispike, act):
+        # ring is (neurons, slots), act is (neurons,)
+        n = len(ispike)
+        for i in range(ring.shape[0]):
+            synI = 0.0
+            for k in range(ring.shape[1]):
+                age = simStep - ring[i, k]
+                if age >= 0 and age < n and ispike[age] > synI:
+                    synI = ispike[age]
+            act[i] = synI
+
+
+class NumbaBackend(NumpyBackend):
+    """
+        Numba JIT compiled loops (one pass over the state, no temporaries); the current stays a BLAS product
+    """
+    name = 'numba'
+
+    def __init__(self):
+        if numba is None:
+            raise ImportError('The numba backend needs Numba installed')
+
+    def integrate(self, v, u, a, b, c, d, I, dt) -> tuple:
+        shape = v.shape
+        v = np.array(v, dtype=float).reshape(-1, shape[-1])
+        u = np.array(u, dtype=float).reshape(-1, shape[-1])
+        I = np.ascontiguousarray(np.broadcast_to(I, shape), dtype=float).reshape(-1, shape[-1])
+        fired = np.empty(v.shape, dtype=np.bool_)
+
+        _integrateJit(v, u, a, b, c, d, I, float(dt), fired)
+
+        return v.reshape(shape), u.reshape(shape), fired.reshape(shape)
+
+    def activation(self, recentSpikes, simStep, ispike) -> np.ndarray:
+        ring = np.ascontiguousarray(recentSpikes).reshape(-1, recentSpikes.shape[-1])
+        act = np.empty(ring.shape[0])
+
+        _activationJit(ring, simStep, np.asarray(ispike, dtype=float), act)
+
+        return act.reshape(recentSpikes.shape[:-1])
+
+
+backends = {'reference' : ReferenceBackend,
+            'numpy'     : NumpyBackend,
+            'numba'     : NumbaBackend}
+
+
+def available() -> list:
+    """
+        Names of the backends that can run on this host
+    """
+    return [name for name in backends if name != 'numba' or numba is not None]
+
+
+def getBackend(name : str = 'numpy'):
+    """
+        Backend object by name: 'reference', 'numpy', 'numba', or 'auto' (numba when installed, numpy otherwise)
+    """
+    if name == 'auto':
+        name = 'numba' if numba is not None else 'numpy'
+    if name not in backends:
+        raise ValueError('Illegal backend {}: must be one of {}'.format(name, list(backends) + ['auto']))
+
+    return backends[name]()
+
+
+def crossCheck(structure : list = [4, 1, 3, 5], phaseDuration : int = 50, dt : float = 0.1, seed : int = 41,
+               I_in : list = None, I_pain : float = 10) -> dict:
+    """
+        Simulates the same network (same seed, so same weights) on every available backend
+        and compares the spike times of every neuron with the reference backend
+        Outputs:
+            dictionary {backend name : True if every spike time matches the reference}
+    """
+    from network import Network
+
+    if I_in is None:
+        I_in = [30 + 10 * i for i in range(structure[0])]
+
+    spikes = dict()
+    for name in available():
+        random.seed(seed)
+        net = Network(phaseDuration=phaseDuration, dt=dt, structure=structure, backend=name,
+                      recordSpikes=True, recordState=())
+        net.step(I_in=I_in, I_pain=I_pain)
+        spikes[name] = [[neu.spikeHistory for neu in layer] for layer in net.neurons]
+
+    return {name : spikes[name] == spikes['reference'] for name in spikes}
+
+
+if __name__ == '__main__':
+    for name, match in crossCheck().items():
+        print(f"{name}: {'matches' if match else 'DIFFERS FROM'} the reference")
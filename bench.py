@@ -0,0 +1,306 @@
+"""
+    Benchmarks of the simulator hot paths
+    benchNeuronStep()   - Neuron.step
+    benchSynapseStep()  - Synapse.step for several presynaptic spike history lengths
+    benchCalcI()        - Neuron._calcI for several fan-ins
+    benchBuild()        - Network construction (buildNetwork) for several structures
+    benchPhase()        - full Network.step phases for several structures, dt values and engines
+    runAll()            - every benchmark, with a description of the machine and commit
+    save() / load()     - results as JSON, so runs can be compared between commits
+    compare()           - speed ratio of every benchmark found in two result sets
+
+    Each benchmark row reports the best time of `repeat` runs, steps per second, synaptic events per second
+    and the peak memory (traced by tracemalloc, in a separate run so tracing doesn't slow the timed runs).
+
+    python bench.py [results.json [baseline.json]] - runs the suite, saves it, and compares it to a baseline
+"""
+
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import funcs
+from synapse import Synapse
+from neuron import Neuron
+from network import Network
+import backend
+
+
+""" Measuring """
+def _time(func, repeat : int) -> float:
+    """
+        Best wall clock time (in s) of repeat calls of func
+    """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def _peakMemory(func) -> int:
+    """
+        Peak memory (in bytes) allocated while func runs
+    """
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak
+
+
+def _row(bench : str, params : dict, seconds : float, steps : int, events : int, peak : int) -> dict:
+    return {'bench'        : bench,
+            'params'       : params,
+            'seconds'      : seconds,
+            'stepsPerSec'  : steps / seconds,
+            'eventsPerSec' : None if events is None else events / seconds,
+            'peakBytes'    : peak
+            }
+
+
+""" Benchmarks """
+def benchNeuronStep(steps : int = 20000, dt : float = 0.1, I_in : float = 30, repeat : int = 3) -> list:
+    """
+        Neuron.step of an input neuron driven by a constant current (no synapses)
+    """
+    def run():
+        neu = Neuron(type=1, recordV=False)
+        for simStep in range(steps):
+            neu.step(simStep=simStep, dt=dt, I_in=I_in)
+
+    return [_row('Neuron.step', {'steps' : steps, 'dt' : dt}, _time(run, repeat), steps, None, _peakMemory(run))]
+
+
+def benchSynapseStep(histories : list = [1, 4, 16, 64], calls : int = 20000, dt : float = 0.1,
+                     repeat : int = 3) -> list:
+    """
+        Synapse.step with `history` presynaptic spikes in flight (spread over the spike shape)
+    """
+    ispike = funcs.ispikeKernel(dt=dt)
+    rows = list()
+    for history in histories:
+        pre = Neuron(type=2, recordV=False)
+        post = Neuron(type=2, recordV=False)
+        syn = Synapse(preNeuron=pre, postNeuron=post, weight=1, ispike=ispike)
+        pre.spikes = [int(i * len(ispike) / history) for i in range(history)]
+        simStep = len(ispike) - 1
+
+        def run():
+            for _ in range(calls):
+                syn.step(simStep=simStep)
+
+        rows.append(_row('Synapse.step', {'history' : history, 'dt' : dt}, _time(run, repeat), calls, calls * history,
+                         _peakMemory(run)))
+
+    return rows
+
+
+def benchCalcI(fanIns : list = [1, 10, 100], calls : int = 2000, dt : float = 0.1, repeat : int = 3) -> list:
+    """
+        Neuron._calcI of a neuron with fanIn input synapses, each with one presynaptic spike in flight
+    """
+    ispike = funcs.ispikeKernel(dt=dt)
+    rows = list()
+    for fanIn in fanIns:
+        post = Neuron(type=2, recordV=False)
+        for _ in range(fanIn):
+            pre = Neuron(type=2, recordV=False)
+            pre.connect(post, 0, ispike=ispike)
+            pre.spikes = [0]
+
+        def run():
+            for _ in range(calls):
+                post._calcI(simStep=10, dt=dt)
+
+        rows.append(_row('Neuron._calcI', {'fanIn' : fanIn, 'dt' : dt}, _time(run, repeat), calls, calls * fanIn,
+                         _peakMemory(run)))
+
+    return rows
+
+
+def benchBuild(structures : list = [[4, 1, 3, 5], [16, 4, 3, 32, 32], [64, 8, 10, 128, 128]], vectorized : bool = True,
+               repeat : int = 3) -> list:
+    """
+        Network construction; steps/s counts networks built per second, events/s synapses created per second
+    """
+    rows = list()
+    for structure in structures:
+        def run():
+            random.seed(41)
+            Network(structure=structure, vectorized=vectorized, recordState=())
+
+        net = Network(structure=structure, vectorized=vectorized, recordState=())
+        if vectorized:
+            synapses = sum(proj.W.size for proj in net.projections)
+        else:
+            synapses = sum(len(neu.outSyns) for layer in net.neurons for neu in layer)
+        rows.append(_row('Network.buildNetwork', {'structure' : structure, 'vectorized' : vectorized},
+                         _time(run, repeat), 1, synapses, _peakMemory(run)))
+
+    return rows
+
+
+def _spikeEvents(net : Network) -> int:
+    """
+        Synaptic events of the last phase: every spike counts once per outgoing synapse
+    """
+    if net.vectorized:
+        return int(sum(pop.spikeCount.sum() * sum(proj.post.size for proj in net.projections if proj.pre is pop)
+                       for pop in net.populations))
+
+    return sum(len(neu.spikeHistory) * len(neu.outSyns) for layer in net.neurons for neu in layer)
+
+
+def benchPhase(structures : list = [[4, 1, 3, 5], [16, 4, 3, 32, 32]], dts : list = [0.1, 0.05],
+               engines : list = None, phaseDuration : int = 50, repeat : int = 3) -> list:
+    """
+        One Network.step phase per run, driven by a fixed input and a pain current
+        Inputs:
+            engines - 'object' (Neuron by Neuron) and/or backend names (see backend.py); None = object and every
+                      available backend except the (slow) reference
+    """
+    if engines is None:
+        engines = ['object'] + [name for name in backend.available() if name != 'reference']
+
+    rows = list()
+    for structure in structures:
+        I_in = [20 + 60 * i / max(structure[0] - 1, 1) for i in range(structure[0])]
+        for dt in dts:
+            for engine in engines:
+                vectorized = engine != 'object'
+
+                def build() -> Network:
+                    random.seed(41)
+                    return Network(phaseDuration=phaseDuration, dt=dt, structure=structure, vectorized=vectorized,
+                                   backend=engine if vectorized else 'numpy', recordSpikes=not vectorized,
+                                   recordState=())
+
+                if vectorized:
+                    net = build()
+
+                    def run():
+                        net.reset()
+                        net.step(I_in=I_in, I_pain=10)
+
+                    run() # warm up (JIT compilation, caches)
+                    seconds = _time(run, repeat)
+                    peak = _peakMemory(run)
+                else:
+                    # Neuron objects can't be reset: every run gets a freshly built network (construction untimed)
+                    seconds = np.inf
+                    for _ in range(repeat):
+                        net = build()
+                        start = time.perf_counter()
+                        net.step(I_in=I_in, I_pain=10)
+                        seconds = min(seconds, time.perf_counter() - start)
+                    fresh = build()
+                    peak = _peakMemory(lambda: fresh.step(I_in=I_in, I_pain=10))
+                events = _spikeEvents(net)
+
+                rows.append(_row('Network.step', {'structure' : structure, 'dt' : dt, 'engine' : engine,
+                                                  'phaseDuration' : phaseDuration},
+                                 seconds, len(net.t), events, peak))
+
+    return rows
+
+
+""" Suite """
+def _commit() -> str:
+    """
+        Hash of the checked out commit (None outside a git checkout)
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runAll(repeat : int = 3) -> dict:
+    """
+        Runs every benchmark with its default parameters
+        Outputs:
+            dictionary with
+                meta    - commit, date, Python / NumPy versions and machine
+                results - list of benchmark rows (see _row)
+    """
+    meta = {'commit'   : _commit(),
+            'date'     : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'machine'  : platform.platform(),
+            'backends' : backend.available()
+            }
+
+    results = list()
+    for bench in [benchNeuronStep, benchSynapseStep, benchCalcI, benchBuild, benchPhase]:
+        results.extend(bench(repeat=repeat))
+
+    return {'meta' : meta, 'results' : results}
+
+
+def save(results : dict, path : str = 'bench.json'):
+    """
+        Writes the results of runAll as JSON
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1)
+
+
+def load(path : str = 'bench.json') -> dict:
+    """
+        Reads results written by save
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _key(row : dict) -> str:
+    return row['bench'] + ' ' + json.dumps(row['params'], sort_keys=True)
+
+
+def compare(baseline : dict, results : dict) -> list:
+    """
+        Matches the benchmarks of two runs
+        Outputs:
+            list of (benchmark, baseline steps/s, new steps/s, speedup) for every benchmark found in both
+    """
+    old = {_key(row) : row for row in baseline['results']}
+    table = list()
+    for row in results['results']:
+        key = _key(row)
+        if key in old:
+            table.append((key, old[key]['stepsPerSec'], row['stepsPerSec'], row['stepsPerSec'] / old[key]['stepsPerSec']))
+
+    return table
+
+
+def report(results : dict):
+    """
+        Prints one line per benchmark
+    """
+    for row in results['results']:
+        events = '' if row['eventsPerSec'] is None else f", {row['eventsPerSec']:.4g} events/s"
+        peak = '' if row['peakBytes'] is None else f", peak {row['peakBytes'] / 1024:.0f} KiB"
+        print(f"{_key(row)}: {row['stepsPerSec']:.4g} steps/s{events}{peak}")
+
+
+if __name__ == '__main__':
+    results = runAll()
+    report(results)
+
+    if len(sys.argv) > 1:
+        save(results, sys.argv[1])
+    if len(sys.argv) > 2:
+        for key, old, new, speedup in compare(load(sys.argv[2]), results):
+            print(f"{key}: {old:.4g} -> {new:.4g} steps/s ({speedup:.2f}x)")
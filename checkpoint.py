@@ -0,0 +1,118 @@
+"""
+    Binary checkpoints of a vectorized Network
+    save(net, path)  - writes the structure, weights, spike shape and (optionally) the dynamic state to a directory
+    load(path)       - rebuilds the Network, memory mapping the weight matrices
+
+    A checkpoint is a directory holding network.json (configuration, layer sizes, simStep) and one .npy file per
+    array: W<i>.npy is the (signed) weight matrix of projection i, params<layer>.npy holds the Izhikevich a, b, c, d
+    arrays of each layer (one row each), and with the state <name><layer>.npy holds the state array <name> (v, u,
+    spike counts, recent spike ring buffer, ...) of each layer.
+"""
+
+import json
+import os
+import numpy as np
+from network import Network
+
+formatVersion = 1
+
+# Population arrays kept in a checkpoint with the state
+_stateArrays = ['v', 'u', 'spikeCount', 'firstSpike', 'recentSpikes', 'recentPos', 'lastSpike', 'pristine', 'settled',
+                'settlePos', 'settleSide']
+
+
+def save(net : Network, path : str, state : bool = False):
+    """
+        Writes a checkpoint of net into the directory path (created if needed)
+        Inputs:
+            net     - vectorized Network
+            path    - checkpoint directory
+            state   - True to also keep the dynamic state (v, u, recent spikes, ..., simStep), so that a network
+                      loaded from the checkpoint resumes the simulation where this one is
+    """
+    if not net.vectorized:
+        raise ValueError('Checkpoints need the vectorized network')
+    os.makedirs(path, exist_ok=True)
+
+    layers = {id(pop) : i for i, pop in enumerate(net.populations)}
+    config = {'format'        : formatVersion,
+              'phaseDuration' : net.phaseDuration,
+              'dt'            : net.dt,
+              'structure'     : list(net.structure),
+              'kernel'        : net.kernel,
+              'spikeShape'    : net.spikeShape,
+              'backend'       : net.backend.name,
+              'gated'         : net.gated,
+              'maxI'          : net.maxI,
+              'projections'   : [[layers[id(proj.pre)], layers[id(proj.post)]] for proj in net.projections],
+              'state'         : state
+              }
+
+    for i, proj in enumerate(net.projections):
+        np.save(os.path.join(path, 'W{}.npy'.format(i)), proj.W)
+    for i, pop in enumerate(net.populations):
+        np.save(os.path.join(path, 'params{}.npy'.format(i)), np.stack([pop.a, pop.b, pop.c, pop.d]))
+
+    if state:
+        config['simStep'] = net.simStep
+        config['batch'] = net.populations[0].batch
+        config['window'] = [pop.window for pop in net.populations]
+        config['restOffset'] = [pop.restOffset for pop in net.populations]
+        for i, pop in enumerate(net.populations):
+            for name in _stateArrays:
+                np.save(os.path.join(path, '{}{}.npy'.format(name, i)), getattr(pop, name))
+            for k, (kernel, filterState) in enumerate(pop.filters.values()):
+                np.save(os.path.join(path, 'filter{}_{}.npy'.format(i, k)), np.stack(filterState))
+
+    with open(os.path.join(path, 'network.json'), 'w') as f:
+        json.dump(config, f, indent=1)
+
+
+def load(path : str, mmap : bool = True, **kwargs) -> Network:
+    """
+        Rebuilds a Network from a checkpoint written by save
+        Inputs:
+            path    - checkpoint directory
+            mmap    - True to memory map the weight matrices (read-only, shared with every process mapping the file;
+                      Projection.adjust and setting a SynapseView weight replace them with ordinary copies), False to
+                      read them into memory
+            kwargs  - further Network arguments (e.g. recordState, recordSpikes, backend)
+        Outputs:
+            the Network, with the saved weights and, if they were saved, in the saved state
+    """
+    with open(os.path.join(path, 'network.json'), 'r') as f:
+        config = json.load(f)
+    if config['format'] != formatVersion:
+        raise ValueError('Unknown checkpoint format {}'.format(config['format']))
+
+    W = [np.load(os.path.join(path, 'W{}.npy'.format(i)), mmap_mode='r' if mmap else None)
+         for i in range(len(config['projections']))]
+
+    options = {'backend' : config['backend'], 'gated' : config['gated']}
+    paramFiles = [os.path.join(path, 'params{}.npy'.format(i)) for i in range(len(config['structure']))]
+    if all(os.path.exists(file) for file in paramFiles):
+        options['params'] = [dict(zip('abcd', np.load(file))) for file in paramFiles]
+    if 'maxI' in config:
+        options['maxI'] = config['maxI']
+    options.update(kwargs)
+    net = Network(phaseDuration=config['phaseDuration'], dt=config['dt'], structure=config['structure'],
+                  kernel=config['kernel'], spikeShape=config['spikeShape'], weights=W, signedWeights=True, **options)
+
+    layers = {id(pop) : i for i, pop in enumerate(net.populations)}
+    for proj, (pre, post) in zip(net.projections, config['projections']):
+        if [layers[id(proj.pre)], layers[id(proj.post)]] != [pre, post]:
+            raise ValueError('Checkpoint projections do not match the network structure')
+
+    if config['state']:
+        net.reset(batch=config['batch'])
+        for i, pop in enumerate(net.populations):
+            pop.setWindow(config['window'][i])
+            pop.restOffset = config.get('restOffset', [0] * len(net.populations))[i]
+            for name in _stateArrays:
+                setattr(pop, name, np.load(os.path.join(path, '{}{}.npy'.format(name, i))))
+            for k, key in enumerate(pop.filters):
+                filterState = np.load(os.path.join(path, 'filter{}_{}.npy'.format(i, k)))
+                pop.filters[key] = (pop.filters[key][0], list(filterState))
+        net.simStep = config['simStep']
+
+    return net
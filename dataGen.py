@@ -10,6 +10,7 @@
 #                                 C D
 
 import json
+import os
 import funcs
 import numpy as np
 
@@ -22,65 +23,80 @@ offThresh = 0.25 # Maximum brightness value to be considered off
 onThresh = 0.5 # Minimum brightness value to be considered on
 # Anything between offThresh and onThresh is illegal
 
-def buildImg(A : int, B : int, C : int, D : int) -> list:
+def _pixelRange(on : int, delta : float = 1/50) -> np.ndarray:
     """
-        Build all the images for the generic image A B C D
+        All the brightness values of one pixel
         value of 1 indicates pixel is on
         value of 0 indicates pixel is off
     """
-    if A == 1:
-        Alim = [onThresh, 1]
+    if on == 1:
+        lim = [onThresh, 1]
     else:
-        Alim = [0, offThresh]
+        lim = [0, offThresh]
 
-    if B == 1:
-        Blim = [onThresh, 1]
-    else:
-        Blim = [0, offThresh]
+    return funcs.floatRange(lim[0], lim[1], delta)
 
-    if C == 1:
-        Clim = [onThresh, 1]
-    else:
-        Clim = [0, offThresh]
 
-    if D == 1:
-        Dlim = [onThresh, 1]
-    else:
-        Dlim = [0, offThresh]
-    imgs = list()
-    for A in funcs.floatRange(Alim[0], Alim[1], 1/50):
-        for B in funcs.floatRange(Blim[0], Blim[1], 1/50):
-            for C in funcs.floatRange(Clim[0], Clim[1], 1/50):
-                for D in funcs.floatRange(Dlim[0], Dlim[1], 1/50):
-                    imgs.append([A, B, C, D])
+def buildImg(A : int, B : int, C : int, D : int, delta : float = 1/50) -> np.ndarray:
+    """
+        Build all the images for the generic image A B C D
+        value of 1 indicates pixel is on
+        value of 0 indicates pixel is off
+        delta is the brightness step (finer grids give more images, see iterImg to build them in chunks)
+
+        Returns an (images, 4) array, in the order of nested loops over A, B, C, D
+    """
+    grids = np.meshgrid(_pixelRange(A, delta), _pixelRange(B, delta), _pixelRange(C, delta), _pixelRange(D, delta),
+                        indexing='ij')
+
+    return np.stack([grid.ravel() for grid in grids], axis=1)
+
+
+def countImg(A : int, B : int, C : int, D : int, delta : float = 1/50) -> int:
+    """
+        Number of images buildImg would build, without building them
+    """
+    return int(np.prod([len(_pixelRange(on, delta)) for on in [A, B, C, D]]))
+
 
-    return imgs
+def iterImg(A : int, B : int, C : int, D : int, delta : float = 1/50, chunkSize : int = 65536):
+    """
+        Lazily yields the images of buildImg (same order) as (chunkSize, 4) arrays (the last one may be shorter),
+        so grids finer than 1/50 never have to be held in memory at once
+    """
+    ranges = [_pixelRange(on, delta) for on in [A, B, C, D]]
+    shape = tuple(len(r) for r in ranges)
+    num = int(np.prod(shape))
 
+    for start in range(0, num, chunkSize):
+        idx = np.unravel_index(np.arange(start, min(start + chunkSize, num)), shape)
+        yield np.stack([r[i] for r, i in zip(ranges, idx)], axis=1)
 
-def buildCrosses() -> list:
+
+def buildCrosses(delta : float = 1/50) -> np.ndarray:
     """
         Generates the Crosses
         Crosses have shape      1 0     or      0 1
                                 0 1             1 0
     """
     # Start with generating the NW-SE crosses
-    NWSECrosses = buildImg(A=1, B=0, C=0, D=1)
+    NWSECrosses = buildImg(A=1, B=0, C=0, D=1, delta=delta)
     print("Built NWSE Crosses")
 
     # Then generate the NE-SW crosses
-    NESWCrosses = buildImg(A=0, B=1, C=1, D=0)
+    NESWCrosses = buildImg(A=0, B=1, C=1, D=0, delta=delta)
     print("Built NESW Crosses")
 
     # Combine the lists
     #data = dict()
     #data['type'] = "Crosses"
     #data['images'] 
-    crosses = NWSECrosses + NESWCrosses
+    crosses = np.concatenate([NWSECrosses, NESWCrosses])
 
     return crosses
 
 
-def buildVertBars() -> list:
+def buildVertBars(delta : float = 1/50) -> np.ndarray:
     """
         Generates the Vertical Bars
         Vertical Bars have the shape    1 0     or      0 1
@@ -88,37 +104,70 @@ def buildVertBars() -> list:
     """
 
     # Start with generating Left Vertical Bars
-    LeftVBars = buildImg(A = 1, B = 0, C = 1, D = 0)
+    LeftVBars = buildImg(A = 1, B = 0, C = 1, D = 0, delta=delta)
     print("Built Left Vertical Bars")
 
     # Then the right
-    RightVBars = buildImg(A = 0, B = 1, C = 0, D = 1)
+    RightVBars = buildImg(A = 0, B = 1, C = 0, D = 1, delta=delta)
     print("Built Right Vertical Bars")
 
     # combine
-    vBars = LeftVBars + RightVBars
+    vBars = np.concatenate([LeftVBars, RightVBars])
 
     return vBars
 
-def buildHorzBars() -> list:
+def buildHorzBars(delta : float = 1/50) -> np.ndarray:
     """
         Generates the Horizontal Bars
         Horizontal Bars have the shape:     1 1     or      0 0
                                             0 0             1 1
     """
     # Start with generating top horizontal bars
-    topHBars = buildImg(A=1, B=1, C=0, D=0)
+    topHBars = buildImg(A=1, B=1, C=0, D=0, delta=delta)
     print("Built Top Horizontal Bars")
 
     # Generate the bottom horizontal Bars
-    botHBars = buildImg(A=0, B=0, C=1, D=1)
+    botHBars = buildImg(A=0, B=0, C=1, D=1, delta=delta)
     print("Built Bottom Horizontal Bars")
 
     # combine
-    hBars = topHBars + botHBars
+    hBars = np.concatenate([topHBars, botHBars])
 
     return hBars
 
+def splitIndex(num : int, start : int = 0) -> dict:
+    """
+        Which set each image of a category goes in: 3 to training, then 1 to testing, then 1 to validation, repeating
+        INPUTS:
+            num   - number of images
+            start - position of the first image in its category (for images handled in chunks)
+        OUTPUTS:
+            dictionary of boolean masks 'train', 'test', 'valid'
+    """
+    pos = (start + np.arange(num)) % 5
+
+    return {'train' : pos < 3,
+            'test'  : pos == 3,
+            'valid' : pos == 4
+            }
+
+
+def splitSets(fromList : np.ndarray, type : int) -> dict:
+    """
+        Splits one category into the train, test, and validation sets
+        INPUTS:
+            fromList - the set to take from (i.e. crosses, vBars, hBars)
+            type     - the type of image this is
+        OUTPUTS:
+            dictionary of (images, labels) array pairs for 'train', 'test', 'valid'
+    """
+    fromList = np.asarray(fromList)
+    masks = splitIndex(len(fromList))
+
+    return {name : (fromList[mask], np.full(np.count_nonzero(mask), type, dtype=np.uint8))
+            for name, mask in masks.items()}
+
+
 def buildSets(train : list, test : list, valid : list, fromList : list, type : int):
     """
         Build the train, test, and validation sets
@@ -128,82 +177,194 @@ def buildSets(train : list, test : list, valid : list, fromList : list, type : i
         OUTPUTS: 
             Nothing, but the training, testing, and validation lists will have all the things added
     """
-    i = 0
-    for img in fromList:
-        if i < 3:
-            # Add 3 to training
-            train.append([img, type])
-            i = i + 1
-
-        elif i == 3:
-            # Add 1 to testing
-            test.append([img, type])
-            i = i + 1
-        else:
-            # Add 1 to validation
-            valid.append([img, type])
-            i = 0
+    sets = splitSets(fromList, type)
+    for toList, name in [(train, 'train'), (test, 'test'), (valid, 'valid')]:
+        toList.extend([img, type] for img in sets[name][0].tolist())
+
+
+def writeSplit(path : str, images, labels):
+    """
+        Writes a set in the binary format: a float32 image array and a uint8 label array
+        INPUTS:
+            path    - file name without extension, e.g. './data/train' (writes train_images.npy and train_labels.npy)
+            images  - (N, 4) images
+            labels  - (N,) image type codes
+    """
+    np.save(path + '_images.npy', np.asarray(images, dtype=np.float32).reshape(-1, 4))
+    np.save(path + '_labels.npy', np.asarray(labels, dtype=np.uint8).reshape(-1))
+
+
+def readSplit(path : str, mmap : bool = True) -> tuple:
+    """
+        Reads a set written by writeSplit
+        INPUTS:
+            path - file name without extension, e.g. './data/train'
+            mmap - memory map the arrays (read only, pages shared between processes) instead of reading them in
+        OUTPUTS:
+            (images, labels) - (N, 4) float32 array and (N,) uint8 array
+    """
+    mode = 'r' if mmap else None
+    images = np.load(path + '_images.npy', mmap_mode=mode)
+    labels = np.load(path + '_labels.npy', mmap_mode=mode)
+
+    return images, labels
+
+
+def writeSets(path : str = './data/', delta : float = 1/50, chunkSize : int = 65536):
+    """
+        Builds every image and writes allImages, train, test and valid in the binary format, one chunk at a time
+        (memory use does not depend on delta)
+        INPUTS:
+            path      - output directory
+            delta     - brightness step of the pixels
+            chunkSize - number of images built at once
+    """
+    # [type, generic images] for every category
+    categories = [[_CROSS, [(1, 0, 0, 1), (0, 1, 1, 0)]],
+                  [_VBAR,  [(1, 0, 1, 0), (0, 1, 0, 1)]],
+                  [_HBAR,  [(1, 1, 0, 0), (0, 0, 1, 1)]]]
+
+    # Count the images going into each file
+    sizes = {'allImages' : 0, 'train' : 0, 'test' : 0, 'valid' : 0}
+    for _, generics in categories:
+        num = sum(countImg(*generic, delta=delta) for generic in generics)
+        sizes['allImages'] += num
+        for name, mask in splitIndex(num).items():
+            sizes[name] += int(np.count_nonzero(mask))
+
+    # Preallocate the files and fill them in chunk by chunk
+    files = dict()
+    for name, size in sizes.items():
+        images = np.lib.format.open_memmap(path + name + '_images.npy', mode='w+', dtype=np.float32, shape=(size, 4))
+        labels = np.lib.format.open_memmap(path + name + '_labels.npy', mode='w+', dtype=np.uint8, shape=(size,))
+        files[name] = [images, labels, 0]
+
+    for type, generics in categories:
+        pos = 0     # position in the category
+        for generic in generics:
+            for chunk in iterImg(*generic, delta=delta, chunkSize=chunkSize):
+                masks = splitIndex(len(chunk), start=pos)
+                masks['allImages'] = np.ones(len(chunk), dtype=bool)
+                for name, mask in masks.items():
+                    images, labels, n = files[name]
+                    num = int(np.count_nonzero(mask))
+                    images[n:n + num] = chunk[mask]
+                    labels[n:n + num] = type
+                    files[name][2] = n + num
+                pos += len(chunk)
+
+    for images, labels, _ in files.values():
+        images.flush()
+        labels.flush()
+
+
+def loadSplit(path : str, mmap : bool = True) -> tuple:
+    """
+        Reads a set in either format: a .json file written by this script, or the binary format (path without extension)
+        OUTPUTS:
+            (images, labels) - (N, 4) float array and (N,) uint8 array of image type codes
+    """
+    if not path.endswith('.json'):
+        return readSplit(path, mmap=mmap)
+
+    with open(path, 'r') as f:
+        data = json.load(f)
+
+    if 'Images' in data:
+        # train / test / valid set
+        images = [img for img, _ in data['Images']]
+        labels = [type for _, type in data['Images']]
+    else:
+        # allImages, sorted by category
+        images = data['Crosses'] + data['VBars'] + data['HBars']
+        labels = [_CROSS] * len(data['Crosses']) + [_VBAR] * len(data['VBars']) + [_HBAR] * len(data['HBars'])
+
+    return np.array(images, dtype=np.float32).reshape(-1, 4), np.array(labels, dtype=np.uint8)
+
+
+def convertJson(jsonPath : str, path : str = None) -> str:
+    """
+        Converts an existing .json file (a set or allImages) to the binary format
+        INPUTS:
+            jsonPath - .json file to convert
+            path     - output file name without extension (defaults to jsonPath without .json)
+        OUTPUTS:
+            the output path
+    """
+    if path is None:
+        path = os.path.splitext(jsonPath)[0]
+
+    images, labels = loadSplit(jsonPath)
+    writeSplit(path, images, labels)
+
+    return path
 
     
 if __name__ == "__main__":
-    crosses = buildCrosses()
-    print("Built Crosses")
-    vBars = buildVertBars()
-    print("Built Vertical Bars")
-    hBars = buildHorzBars()
-    print("Built Horizontal Bars")
-
-    # Create output dictionary for json file
-    allImgs = dict()
-    allImgs['Num Crosses'] = len(crosses)
-    allImgs['Crosses'] = crosses
-    allImgs['Num VBars'] = len(vBars)
-    allImgs['VBars'] = vBars
-    allImgs['Num HBars'] = len(hBars)
-    allImgs['HBars'] = hBars
-
-    # Write to JSON file
     path = './data/'
-   
-    # write to file
-    with open('{}{}.json'.format(path,"allImages"), 'w') as f:
-        json.dump(allImgs, f)
-
-    # Create validation, testing, and training datasets
-    # 60, 20, 20 split
-    # in other words, throw 3 random values in training, then 1 in testing, then 1 in validation
-
-    testing = list()
-    training = list()
-    validation = list()
-
-    # Add the stuff to the sets
-    # Importantly, this list will be sorted by category.  It's important to access this randomly when actually using
-    buildSets(train=training, test=testing, valid=validation, fromList=crosses, type=_CROSS)
-    buildSets(train=training, test=testing, valid=validation, fromList=vBars, type=_VBAR)
-    buildSets(train=training, test=testing, valid=validation, fromList=hBars, type=_HBAR)
-
-    # Create dictionaries
-    testDict = dict()
-    trainDict = dict()
-    validDict = dict()
-
-    trainDict['Num Images'] = len(training)
-    testDict['Num Images'] = len(testing)
-    validDict['Num Images'] = len(validation)
-
-    trainDict['Images'] = training
-    testDict['Images'] = testing
-    validDict['Images'] = validation
-
-    # Print Training data to file
-    with open('{}{}.json'.format(path,"train"), 'w') as f:
-        json.dump(trainDict, f)
-
-     # Print Testing data to file
-    with open('{}{}.json'.format(path,"test"), 'w') as f:
-        json.dump(testDict, f)
-
-     # Print Validation data to file
-    with open('{}{}.json'.format(path,"valid"), 'w') as f:
-        json.dump(validDict, f)
\ No newline at end of file
+    writeFormat = 'json' # 'json' for the .json files, 'npy' for the binary format (see writeSplit)
+    delta = 1/50         # brightness step of the pixels
+
+    if writeFormat == 'npy':
+        # Build and write the images chunk by chunk
+        writeSets(path, delta=delta)
+        print("Wrote all images, training, testing and validation sets")
+    else:
+        crosses = buildCrosses(delta)
+        print("Built Crosses")
+        vBars = buildVertBars(delta)
+        print("Built Vertical Bars")
+        hBars = buildHorzBars(delta)
+        print("Built Horizontal Bars")
+
+        # Create output dictionary for json file
+        allImgs = dict()
+        allImgs['Num Crosses'] = len(crosses)
+        allImgs['Crosses'] = crosses.tolist()
+        allImgs['Num VBars'] = len(vBars)
+        allImgs['VBars'] = vBars.tolist()
+        allImgs['Num HBars'] = len(hBars)
+        allImgs['HBars'] = hBars.tolist()
+
+        # Write to JSON file
+        with open('{}{}.json'.format(path,"allImages"), 'w') as f:
+            json.dump(allImgs, f)
+
+        # Create validation, testing, and training datasets
+        # 60, 20, 20 split
+        # in other words, throw 3 random values in training, then 1 in testing, then 1 in validation
+
+        testing = list()
+        training = list()
+        validation = list()
+
+        # Add the stuff to the sets
+        # Importantly, this list will be sorted by category.  It's important to access this randomly when actually using
+        buildSets(train=training, test=testing, valid=validation, fromList=crosses, type=_CROSS)
+        buildSets(train=training, test=testing, valid=validation, fromList=vBars, type=_VBAR)
+        buildSets(train=training, test=testing, valid=validation, fromList=hBars, type=_HBAR)
+
+        # Create dictionaries
+        testDict = dict()
+        trainDict = dict()
+        validDict = dict()
+
+        trainDict['Num Images'] = len(training)
+        testDict['Num Images'] = len(testing)
+        validDict['Num Images'] = len(validation)
+
+        trainDict['Images'] = training
+        testDict['Images'] = testing
+        validDict['Images'] = validation
+
+        # Print Training data to file
+        with open('{}{}.json'.format(path,"train"), 'w') as f:
+            json.dump(trainDict, f)
+
+         # Print Testing data to file
+        with open('{}{}.json'.format(path,"test"), 'w') as f:
+            json.dump(testDict, f)
+
+         # Print Validation data to file
+        with open('{}{}.json'.format(path,"valid"), 'w') as f:
+            json.dump(validDict, f)
@@ -0,0 +1,154 @@
+"""
+    Early-exit decision rules for the vectorized network
+    FirstSpike(net)        - the first output neuron to spike wins
+    TimeToFirstSpike(net)  - the earliest output spike wins once it leads every other output by gap ms
+    CountMargin(net)       - the output with the most spikes wins once it leads every other output by margin spikes
+
+    A rule registers itself as net.decision; Network.step then stops the phase as soon as every sample is decided.
+    Samples that are still undecided at the end of the phase fall back to the output with the most spikes.
+"""
+
+import numpy as np
+
+
+class DecisionRule(object):
+    """
+        Base class of the decision rules; subclasses supply decide()
+
+        Fields:
+        net          - the (vectorized) Network; the rule registers itself as net.decision
+        winner       - index of the winning output neuron of each sample (-1 = none yet / no output spike)
+        decisionStep - time index at which each sample was decided (-1 = not decided before the end of the phase)
+    """
+    def __init__(self, net):
+        if not net.vectorized:
+            raise ValueError('Decision rules need the vectorized network')
+
+        self.net = net
+
+        self.reset()
+        net.decision = self
+
+    def options(self) -> dict:
+        """
+            Keyword arguments that rebuild this rule on another network (e.g. in an evaluate worker)
+        """
+        return dict()
+
+    def reset(self):
+        """
+            Forgets the decisions, sized for the current batch of the network
+        """
+        shape = self.net.populations[-1].v.shape[:-1]
+        self.winner = np.full(shape, -1, dtype=np.int64)
+        self.decisionStep = np.full(shape, -1, dtype=np.int64)
+
+    def decide(self, counts : np.ndarray, firstSpike : np.ndarray, simStep : int) -> tuple:
+        """
+            Applies the rule to the output layer after the step simStep
+            Inputs:
+                counts      - output spike counts so far, (outputs,) or (batch, outputs)
+                firstSpike  - time index of the first spike of each output (-1 = none yet)
+                simStep     - time index of the step just taken
+            Outputs:
+                (decided, winner) - per sample, whether the winner is settled and which output it is
+        """
+        raise NotImplementedError
+
+    def update(self, simStep : int) -> bool:
+        """
+            Records the samples decided by the step simStep
+            Outputs:
+                True once every sample is decided (the phase can stop)
+        """
+        out = self.net.populations[-1]
+        undecided = self.decisionStep < 0
+        decided, winner = self.decide(out.spikeCount, out.firstSpike, simStep)
+        decided, winner = np.asarray(decided), np.asarray(winner)
+
+        new = undecided & decided
+        self.winner[new] = winner[new]
+        self.decisionStep[new] = simStep
+
+        return bool(np.all(self.decisionStep >= 0))
+
+    def endPhase(self):
+        """
+            Gives the samples left undecided the output with the most spikes (-1 if no output spiked)
+        """
+        counts = self.net.populations[-1].spikeCount
+        undecided = self.decisionStep < 0
+        fallback = np.where(counts.max(axis=-1) > 0, np.argmax(counts, axis=-1), -1)
+        self.winner[undecided] = fallback[undecided]
+
+
+class TimeToFirstSpike(DecisionRule):
+    """
+        Latency code: the output that spikes first wins.  A sample is decided once the earliest first spike leads
+        every other output's first spike (or the next step, for outputs that have not spiked) by at least gap ms,
+        or as soon as a second output spikes (the lead can no longer change).  Ties go to the lower index.
+
+        Fields:
+        gap         - required lead (in ms) of the first spike
+    """
+    def __init__(self, net, gap : float = 1.0):
+        self.gap = gap
+        super().__init__(net)
+
+    def options(self) -> dict:
+        return {'gap' : self.gap}
+
+    def decide(self, counts, firstSpike, simStep) -> tuple:
+        spiked = firstSpike >= 0
+        # an output that has not spiked yet can spike at the next step at the earliest
+        first = np.where(spiked, firstSpike, simStep + 1)
+
+        winner = np.argmin(first, axis=-1)
+        if first.shape[-1] < 2:
+            return spiked[..., 0], winner
+
+        ordered = np.partition(first, 1, axis=-1)
+        lead = (ordered[..., 1] - ordered[..., 0]) * self.net.dt
+        numSpiked = np.count_nonzero(spiked, axis=-1)
+        decided = (numSpiked >= 2) | ((numSpiked == 1) & (lead >= self.gap))
+
+        return decided, winner
+
+
+class FirstSpike(TimeToFirstSpike):
+    """
+        The first output neuron to spike wins, decided at that spike (ties go to the lower index)
+    """
+    def __init__(self, net):
+        super().__init__(net, gap=0)
+
+    def options(self) -> dict:
+        return dict()
+
+
+class CountMargin(DecisionRule):
+    """
+        Rate code: the output with the most spikes wins once it has margin more spikes than every other output
+
+        Fields:
+        margin      - required lead in spikes
+    """
+    def __init__(self, net, margin : int = 2):
+        if margin < 1:
+            raise ValueError('Illegal margin: must be at least 1')
+
+        self.margin = margin
+        super().__init__(net)
+
+    def options(self) -> dict:
+        return {'margin' : self.margin}
+
+    def decide(self, counts, firstSpike, simStep) -> tuple:
+        winner = np.argmax(counts, axis=-1)
+        if counts.shape[-1] < 2:
+            return counts[..., 0] >= self.margin, winner
+
+        ordered = np.partition(counts, -2, axis=-1)
+        decided = ordered[..., -1] - ordered[..., -2] >= self.margin
+
+        return decided, winner
@@ -0,0 +1,204 @@
+"""
+    Dataset evaluation across a process pool
+    evaluate(net, path) - runs every image of a dataGen split file through the network and scores the outputs
+
+    The weights and spike shape of the network are placed in shared memory once; every worker builds a network of
+    the same structure and points its projections at the shared arrays instead of unpickling its own copy.
+"""
+
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+import funcs
+from network import Network
+from kernel import RecursiveKernel
+from adaptive import AdaptiveStepper
+from dataGen import loadSplit
+
+
+""" Shared memory helpers """
+def _share(arr : np.ndarray) -> tuple:
+    """
+        Copies arr into a new shared memory block
+        Outputs:
+            (SharedMemory, descriptor) - descriptor is the picklable (name, shape, dtype) used by _attach
+    """
+    arr = np.ascontiguousarray(arr)
+    shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+    view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+    view[...] = arr
+
+    return shm, (shm.name, arr.shape, arr.dtype.str)
+
+
+def _attach(desc : tuple) -> tuple:
+    """
+        Attaches to a shared memory block made by _share
+        Outputs:
+            (SharedMemory, read-only array view of the block)
+    """
+    name, shape, dtype = desc
+    shm = shared_memory.SharedMemory(name=name)
+    arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    arr.flags.writeable = False
+
+    return shm, arr
+
+
+""" Worker side """
+_worker = dict()    # per process state: the network, its input currents and the shared memory handles
+
+
+def _initWorker(config : dict, weightDescs : list, ispikeDesc : tuple, currentDesc : tuple):
+    """
+        Pool initializer: builds the network (same engine: backend, gating, adaptive stepping) and points it at
+        the shared weights, spike shape and input currents
+    """
+    net = Network(phaseDuration=config['phaseDuration'], dt=config['dt'], structure=config['structure'],
+                  kernel=config['kernel'], spikeShape=config['spikeShape'], maxI=config['maxI'],
+                  params=config['params'], backend=config['backend'], gated=config['gated'], recordState=())
+    if config['adaptive'] is not None:
+        net.adaptive = AdaptiveStepper(net, **config['adaptive'])
+    if config['decision'] is not None:
+        rule, options = config['decision']
+        rule(net, **options)
+    handles = list()
+
+    shm, ispike = _attach(ispikeDesc)
+    handles.append(shm)
+    for proj, desc in zip(net.projections, weightDescs):
+        shm, W = _attach(desc)
+        handles.append(shm)
+        proj.W = W
+        if not isinstance(proj.ispikeShape, RecursiveKernel):
+            proj.ispikeShape = ispike
+
+    shm, currents = _attach(currentDesc)
+    handles.append(shm)
+
+    _worker['net'] = net
+    _worker['currents'] = currents
+    _worker['handles'] = handles
+
+
+def _runChunk(chunk : tuple) -> tuple:
+    """
+        Simulates the images [start, stop) in batches of batchSize
+        Outputs:
+            (start, counts, firstSpike, winner, decisionTime) - the last two are None without a decision rule
+    """
+    start, stop, batchSize = chunk
+    net = _worker['net']
+    currents = _worker['currents']
+
+    counts = list()
+    first = list()
+    winner = list()
+    decisionTime = list()
+    for i in range(start, stop, batchSize):
+        out = net.run(currents[i:min(i + batchSize, stop)])
+        counts.append(out['counts'])
+        first.append(out['firstSpike'])
+        if net.decision is not None:
+            winner.append(out['winner'])
+            decisionTime.append(out['decisionTime'])
+
+    if net.decision is None:
+        return start, np.concatenate(counts), np.concatenate(first), None, None
+    return start, np.concatenate(counts), np.concatenate(first), np.concatenate(winner), np.concatenate(decisionTime)
+
+
+""" Parent side """
+def evaluate(net : Network, path : str = None, images : np.ndarray = None, labels : np.ndarray = None,
+             processes : int = None, chunkSize : int = 256, batchSize : int = 64) -> dict:
+    """
+        Runs every image through the network (one phase per image) on a pool of worker processes.
+        Results are merged in image order, so they match a single process run exactly.
+        The workers simulate with the network's backend, activity gating and adaptive stepping settings.
+        If the network has a decision rule (net.decision) the workers use it to end each phase early.
+        Inputs:
+            net         - vectorized Network to evaluate (its weights are shared with the workers)
+            path        - dataGen set to evaluate, .json or binary (see dataGen.loadSplit); or give images and labels
+            images      - (N, 4) array of images
+            labels      - (N,) array of image type codes (1 = cross, 2 = vertical bar, 3 = horizontal bar)
+            processes   - number of worker processes (None = one per core, 1 = run in this process)
+            chunkSize   - number of images handed to a worker at a time
+            batchSize   - number of images a worker simulates at once (see Network.run)
+        Outputs:
+            dictionary with
+                counts      - (N, outputs) output spike counts over the steps simulated: with a decision rule a
+                              batch stops once all its samples are decided, so the counts of a sample decided
+                              earlier also include the spikes after its own decision
+                firstSpike  - (N, outputs) time index of the first output spike (-1 = none)
+                predicted   - (N,) predicted type code (output neuron with the most spikes, or the winner of the
+                              decision rule, + 1)
+                accuracy    - fraction of images predicted correctly (None without labels)
+                decisionTime - (N,) time (in ms) each image was decided (nan = end of phase; None without a rule)
+    """
+    if not net.vectorized:
+        raise ValueError('evaluate needs a vectorized Network')
+    if path is not None:
+        images, labels = loadSplit(path)
+
+    currents = funcs.imgCurrent(images)
+    chunks = [(i, min(i + chunkSize, len(currents)), batchSize) for i in range(0, len(currents), chunkSize)]
+
+    config = {'phaseDuration' : net.phaseDuration,
+              'dt'            : net.dt,
+              'structure'     : net.structure,
+              'kernel'        : net.kernel,
+              'spikeShape'    : net.spikeShape,
+              'maxI'          : net.maxI,
+              'params'        : [{'a' : pop.a, 'b' : pop.b, 'c' : pop.c, 'd' : pop.d} for pop in net.populations],
+              'backend'       : net.backend.name,
+              'gated'         : net.gated,
+              'adaptive'      : None if net.adaptive is None else net.adaptive.options(),
+              'decision'      : None if net.decision is None else (type(net.decision), net.decision.options())}
+
+    # Put the weights, spike shape and inputs in shared memory
+    shared = [_share(proj.W) for proj in net.projections]
+    ispike = [proj.ispikeShape for proj in net.projections if not isinstance(proj.ispikeShape, RecursiveKernel)]
+    ispikeShm, ispikeDesc = _share(ispike[0] if len(ispike) > 0 else funcs.ispikeKernel(dt=net.dt))
+    currentShm, currentDesc = _share(currents)
+    handles = [shm for shm, _ in shared] + [ispikeShm, currentShm]
+    initArgs = (config, [desc for _, desc in shared], ispikeDesc, currentDesc)
+
+    try:
+        if processes == 1:
+            _initWorker(*initArgs)
+            results = [_runChunk(chunk) for chunk in chunks]
+            _worker.clear()
+        else:
+            with mp.Pool(processes=processes, initializer=_initWorker, initargs=initArgs) as pool:
+                results = pool.map(_runChunk, chunks)
+    finally:
+        for shm in handles:
+            shm.close()
+            shm.unlink()
+
+    # Merge in image order
+    results.sort(key=lambda result: result[0])
+    counts = np.concatenate([result[1] for result in results])
+    firstSpike = np.concatenate([result[2] for result in results])
+    predicted = np.argmax(counts, axis=1) + 1
+    decisionTime = None
+    if net.decision is not None:
+        predicted = np.concatenate([result[3] for result in results]) + 1
+        decisionTime = np.concatenate([result[4] for result in results])
+
+    accuracy = None
+    if labels is not None:
+        accuracy = float(np.mean(predicted == labels))
+
+    return {'counts'       : counts,
+            'firstSpike'   : firstSpike,
+            'predicted'    : predicted,
+            'accuracy'     : accuracy,
+            'decisionTime' : decisionTime
+            }
+
+
+if __name__ == '__main__':
+    net = Network(structure=[4, 1, 3, 10], recordState=())
+    results = evaluate(net, path='./data/test.json')
+    print(f"Accuracy: {results['accuracy']}")
@@ -1,12 +1,20 @@
 """
     File Containing Helper functions for the code
     ispike(dt) - generates an np.array of the current spike
+    ispikeKernel(dt) - shared, read-only ispike current (memoized, least recently used shapes are evicted)
+    imgCurrent(imgs) - converts pixel brightness to input neuron currents
+    randomUniform(n) - n draws of random.random() in one call
 
 """
 
+from collections import OrderedDict
+import random
 import numpy as np
 import matplotlib.pyplot as plt
 
+kernelCacheSize = 16        # number of spike shapes kept by ispikeKernel
+_kernelCache = OrderedDict() # (dt, rt, ft, holdTime) -> read-only current array, least recently used first
+
 
 def ispike(dt : float = 0.1, rt : float = 2, ft : float = 35, holdTime : float = 0):
     """
@@ -53,6 +61,34 @@ def ispike(dt : float = 0.1, rt : float = 2, ft : float = 35, holdTime : float =
             'time'    : t
             }
 
+def ispikeKernel(dt : float = 0.1, rt : float = 2, ft : float = 35, holdTime : float = 0) -> np.ndarray:
+    """
+        Current spike shape of ispike, shared between every caller asking for the same parameters.
+        The array is read only; the exponentials are only computed the first time a shape is asked for
+        (or after it has been evicted as the least recently used of kernelCacheSize shapes).
+    """
+    key = (float(dt), float(rt), float(ft), float(holdTime))
+    if key in _kernelCache:
+        _kernelCache.move_to_end(key)
+        return _kernelCache[key]
+
+    current = ispike(dt=dt, rt=rt, ft=ft, holdTime=holdTime)['current']
+    current.flags.writeable = False
+    _kernelCache[key] = current
+
+    while len(_kernelCache) > kernelCacheSize:
+        _kernelCache.popitem(last=False)
+
+    return current
+
+
+def clearKernelCache():
+    """
+        Forgets every spike shape kept by ispikeKernel
+    """
+    _kernelCache.clear()
+
+
 """ Tester Functions """
 def _test_ispike(dt : float = 0.1):
     """
@@ -77,15 +113,43 @@ def _test_ispike(dt : float = 0.1):
     plt.show()
 
 
+def imgCurrent(imgs, gain : float = 80) -> np.ndarray:
+    """
+        Converts images (pixel brightness 0-1) to input neuron currents
+        Inputs:
+            imgs - one image [A, B, C, D] or an (images, pixels) array
+            gain - current for a fully on pixel (defaults to the maximum synapse current)
+        Outputs:
+            array of input currents, same shape as imgs
+    """
+    return gain * np.asarray(imgs, dtype=float)
+
+
+def randomUniform(n : int) -> np.ndarray:
+    """
+        Same numbers as n successive random.random() calls (and leaves the generator in the same state),
+        drawn with a single getrandbits call: random.random() builds each float from two 32 bit outputs of the
+        generator, the high 27 and 26 bits of which give the 53 bit mantissa
+    """
+    if n == 0:
+        return np.empty(0)
+
+    words = np.frombuffer(random.getrandbits(64 * n).to_bytes(8 * n, 'little'), dtype='<u4').reshape(n, 2)
+    a = (words[:, 0] >> 5).astype(float)
+    b = (words[:, 1] >> 6).astype(float)
+
+    return (a * 67108864.0 + b) * (1.0 / 9007199254740992.0)
+
+
 def floatRange(start : float, end : float, delta : float):
     """
         Like range but for floats
     """
     num = int((end - start)/delta)
-    y = np.empty(num)
+    y = np.full(num, delta)
     y[0] = start
-    for i in range(1, num - 1):
-        y[i] = y[i-1] + delta
+    # running sum gives the same values as adding delta one step at a time
+    y = np.cumsum(y)
 
     y[-1] = end
 
@@ -0,0 +1,127 @@
+"""
+    Online learning for the vectorized network
+    STDP(net) - trace based spike timing dependent plasticity, applied to whole weight matrices
+
+    Every layer keeps a presynaptic and a postsynaptic eligibility trace (exponentially decaying, +1 per spike).
+    When a postsynaptic neuron spikes its input weights grow by the presynaptic traces (pre before post);
+    when a presynaptic neuron spikes its output weights shrink by the postsynaptic traces (post before pre).
+    Activity of the pain neurons modulates the update, turning potentiation into depression when pain is strong.
+"""
+
+import math
+import numpy as np
+
+
+def _outer(post : np.ndarray, pre : np.ndarray) -> np.ndarray:
+    """
+        (post.size, pre.size) outer product of a post- and a presynaptic vector, summed over the batch if batched
+    """
+    post = np.reshape(post, (-1, post.shape[-1]))
+    pre = np.reshape(pre, (-1, pre.shape[-1]))
+
+    return post.T @ pre
+
+
+class STDP(object):
+    """
+        Spike timing dependent plasticity on every Projection of a Network
+
+        Fields:
+        net         - the (vectorized) Network being trained; the rule registers itself as net.learning
+        lr          - learning rate
+        tauPre      - time constant (in ms) of the presynaptic traces
+        tauPost     - time constant (in ms) of the postsynaptic traces
+        aPlus       - strength of potentiation (pre before post)
+        aMinus      - strength of depression (post before pre)
+        painGain    - how strongly pain activity modulates learning: updates are scaled by
+                      1 - painGain * (mean postsynaptic trace of the pain layer), per sample, clipped to [-1, 1]
+                      (strong pain mirrors the update at most, it never amplifies it)
+        every       - 'step' to apply updates every simulation step, 'phase' to accumulate them over a phase
+        preTrace    - presynaptic trace of each layer, parallel to net.populations
+        postTrace   - postsynaptic trace of each layer, parallel to net.populations
+        pending     - accumulated updates of each projection when every = 'phase'
+    """
+    def __init__(self, net, lr : float = 0.01, tauPre : float = 20, tauPost : float = 20, aPlus : float = 1.0,
+                 aMinus : float = 1.05, painGain : float = 1.0, every : str = 'step'):
+        if not net.vectorized:
+            raise ValueError('STDP needs the vectorized network')
+        if every not in ('step', 'phase'):
+            raise ValueError('Illegal every: must be \'step\' or \'phase\'')
+
+        self.net        = net
+        self.lr         = lr
+        self.tauPre     = tauPre
+        self.tauPost    = tauPost
+        self.aPlus      = aPlus
+        self.aMinus     = aMinus
+        self.painGain   = painGain
+        self.every      = every
+
+        self.preDecay   = math.exp(-1 * net.dt / tauPre)
+        self.postDecay  = math.exp(-1 * net.dt / tauPost)
+
+        # layer index of each projection's pre and post population
+        index = {id(pop) : i for i, pop in enumerate(net.populations)}
+        self.layers = [(index[id(proj.pre)], index[id(proj.post)]) for proj in net.projections]
+        self.pain = [i for i, pop in enumerate(net.populations) if pop.type == -1]
+
+        self.reset()
+        net.learning = self
+
+    def reset(self):
+        """
+            Clears the traces (and any pending updates), e.g. when the network state is reset
+        """
+        self.preTrace = [np.zeros(pop.v.shape) for pop in self.net.populations]
+        self.postTrace = [np.zeros(pop.v.shape) for pop in self.net.populations]
+        self.pending = [np.zeros(proj.W.shape) for proj in self.net.projections]
+
+    def _modulation(self) -> np.ndarray:
+        """
+            Pain modulation factor, one per sample (a scalar when unbatched)
+        """
+        if len(self.pain) == 0 or self.painGain == 0:
+            return np.ones(self.postTrace[0].shape[:-1])
+
+        painActivity = np.mean(np.concatenate([self.postTrace[i] for i in self.pain], axis=-1), axis=-1)
+        return np.clip(1 - self.painGain * painActivity, -1, 1)
+
+    def step(self, spiked : list):
+        """
+            Updates the traces and the weights after one simulation step
+            Inputs:
+                spiked - boolean arrays of the neurons that spiked this step, parallel to net.populations
+        """
+        # Decay the traces, then add this step's spikes
+        for i, fired in enumerate(spiked):
+            self.preTrace[i] = self.preTrace[i] * self.preDecay + fired
+            self.postTrace[i] = self.postTrace[i] * self.postDecay + fired
+
+        mod = self._modulation()[..., None]
+
+        for k, (proj, (pre, post)) in enumerate(zip(self.net.projections, self.layers)):
+            postFired = spiked[post]
+            preFired = spiked[pre]
+            if not (postFired.any() or preFired.any()):
+                continue
+
+            # potentiate inputs of neurons that just spiked, depress outputs of neurons that just spiked
+            # (summed over the batch when batched)
+            strength = (self.aPlus * _outer(mod * postFired, self.preTrace[pre])
+                        - self.aMinus * _outer(mod * self.postTrace[post], preFired))
+
+            if self.every == 'step':
+                proj.adjust(self.lr, strength)
+            else:
+                self.pending[k] += strength
+
+    def endPhase(self):
+        """
+            Applies the updates accumulated over the phase (every = 'phase')
+        """
+        if self.every != 'phase':
+            return
+
+        for k, proj in enumerate(self.net.projections):
+            proj.adjust(self.lr, self.pending[k])
+            self.pending[k][:] = 0
@@ -0,0 +1,150 @@
+"""
+    Minibatch loader for the train, test and validation sets
+    The sets are sorted by category, so every epoch reads them through a seeded random permutation of the indices.
+    The next minibatch is gathered and converted to input currents on a background thread while the network
+    simulates the current one.
+"""
+
+import os
+import queue
+import threading
+import numpy as np
+import funcs
+from synapse import maxI
+from dataGen import loadSplit
+
+
+class Loader(object):
+    """
+        Shuffled minibatches of one set
+
+        Fields:
+        images      - (N, 4) images (memory mapped when read from the binary format)
+        labels      - (N,) image type codes
+        batchSize   - number of images per minibatch
+        seed        - seed of the shuffles; epoch e of a given seed always has the same order
+        shuffle     - False to read the set in file order
+        prefetch    - True to prepare the next minibatch on a background thread
+        gain        - input current of a fully on pixel (see funcs.imgCurrent)
+        dropLast    - True to skip the last minibatch if it is smaller than batchSize
+        epoch       - number of epochs handed out so far
+    """
+    def __init__(self, path : str = None, images : np.ndarray = None, labels : np.ndarray = None, batchSize : int = 64,
+                 seed : int = 0, shuffle : bool = True, prefetch : bool = True, gain : float = maxI,
+                 dropLast : bool = False):
+        if path is not None:
+            images, labels = loadSplit(path)
+
+        self.images     = images
+        self.labels     = labels
+        self.batchSize  = batchSize
+        self.seed       = seed
+        self.shuffle    = shuffle
+        self.prefetch   = prefetch
+        self.gain       = gain
+        self.dropLast   = dropLast
+        self.epoch      = 0
+
+    def __len__(self) -> int:
+        """
+            Number of minibatches per epoch
+        """
+        if self.dropLast:
+            return len(self.images) // self.batchSize
+        return -(-len(self.images) // self.batchSize)
+
+    def order(self, epoch : int) -> np.ndarray:
+        """
+            Index permutation used for the given epoch
+        """
+        if not self.shuffle:
+            return np.arange(len(self.images))
+
+        return np.random.default_rng([self.seed, epoch]).permutation(len(self.images))
+
+    def _batch(self, idx : np.ndarray) -> tuple:
+        """
+            Gathers one minibatch as contiguous arrays
+            Outputs:
+                (currents, labels) - (batch, 4) input currents and (batch,) type codes
+        """
+        # read in file order (much kinder to a memory mapped file), then put back in shuffled order
+        sort = np.argsort(idx)
+        images = np.empty((len(idx), 4), dtype=self.images.dtype)
+        labels = np.empty(len(idx), dtype=self.labels.dtype)
+        images[sort] = self.images[idx[sort]]
+        labels[sort] = self.labels[idx[sort]]
+
+        return funcs.imgCurrent(images, gain=self.gain), labels
+
+    def _batches(self, order : np.ndarray):
+        """
+            Generates the minibatches of one epoch in the given order
+        """
+        for i in range(len(self)):
+            yield self._batch(order[i * self.batchSize:(i + 1) * self.batchSize])
+
+    def __iter__(self):
+        """
+            Iterates over one epoch of (currents, labels) minibatches; the next iteration is the next epoch
+        """
+        order = self.order(self.epoch)
+        self.epoch = self.epoch + 1
+
+        if not self.prefetch:
+            yield from self._batches(order)
+            return
+
+        ready = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # hand an item to the consumer, giving up if it has stopped listening
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def work():
+            try:
+                for batch in self._batches(order):
+                    if not put(batch):
+                        return
+                put(None)
+            except Exception as err:
+                put(err)
+
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        try:
+            while True:
+                batch = ready.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            # stops the worker if the consumer quits early
+            stop.set()
+            worker.join()
+
+
+def loadSets(path : str = './data/', **kwargs) -> dict:
+    """
+        Loaders for the train, test and validation sets in a directory written by dataGen
+        (binary format if present, .json otherwise).  Keyword arguments are passed on to Loader.
+        Outputs:
+            dictionary of Loaders 'train', 'test', 'valid'
+    """
+    loaders = dict()
+    for name in ['train', 'test', 'valid']:
+        setPath = os.path.join(path, name)
+        if not os.path.exists(setPath + '_images.npy'):
+            setPath = setPath + '.json'
+        loaders[name] = Loader(path=setPath, **kwargs)
+
+    return loaders
@@ -1,8 +1,17 @@
 import numpy as np
 import math
+from time import perf_counter
 import matplotlib.pyplot as plt
 import funcs
-from neuron import Neuron
+import synapse
+from synapse import maxI
+from neuron import Neuron, paramArrays
+from population import Population
+from projection import Projection
+from kernel import RecursiveKernel
+from recorder import RasterRecorder
+from backend import getBackend
+from adaptive import AdaptiveStepper
 
 class Network(object):
     """
@@ -16,16 +25,118 @@ class Network(object):
         t               - time vector for each phase
         simStep         - Simulation step (which time index in vector t are we)
         neurons         - 2D list of Neuron objects [inputs, pain, hl1, hl2, ..., output]
+        vectorized      - True to advance each layer as a Population (default), False to step Neuron objects one by one
+        populations     - list of Population objects, parallel to neurons (None when not vectorized)
+        projections     - list of Projection weight matrices, one per connected pair of layers (vectorized only)
+        kernel          - synapse current mode: 'table' looks up the ispike shape for every spike in flight and takes
+                          the strongest value, 'recursive' uses a RecursiveKernel (filter states updated once per step,
+                          vectorized only), which adds overlapping spikes up instead: a fast spiking neuron drives its
+                          synapses harder than in 'table' mode (see kernel.py), so the two give different firing rates
+        recursiveKernel - the RecursiveKernel shared by all projections (None in 'table' mode)
+        raster          - RasterRecorder keeping the full spike history of the whole network (None when recordSpikes
+                          is False; neurons then only keep their recent spikes); neuron ids run through the layers
+                          in the order of neurons.  Streamed to the file spikeFile if one is given (close() the
+                          network, or use it in a with block, to write the last spikes and close the file).
+        recorders       - per layer views of the raster (recorder.RasterView), parallel to neurons
+        recordState     - state variables ('v', 'u', 'I') recorded for every layer; () records nothing
+                          (see record() for per layer / per neuron selection)
+        recordEvery     - decimation factor of the state recording (one sample every recordEvery steps)
+        learning        - online learning rule updated every step (e.g. learning.STDP), None = no learning
+        stats           - profiling.StepStats collecting per layer timings, spikes and synaptic events every step
+                          (None = no instrumentation)
+        decision        - early-exit rule that ends the phase once the winning output is settled
+                          (e.g. decision.FirstSpike), None = always run the whole phase
+        backend         - kernels used by the vectorized network: 'numpy' (default), 'reference' (pure Python,
+                          same arithmetic as Neuron.step / Synapse.step), 'numba' (JIT, needs Numba installed),
+                          or 'auto' (numba when installed, numpy otherwise); see backend.py
+        adaptive        - AdaptiveStepper taking steps longer than dt while the dynamics are slow
+                          (None = fixed dt); its stats report the steps saved.  State recordings still hold one
+                          sample per step of t, the ones inside a long step interpolated linearly, and the decision
+                          rule is still asked at every step
+        spikeShape      - rise time rt, fall time ft and holdTime (in ms) of the current spike (see funcs.ispike),
+                          used by both kernels
+        params          - Izhikevich parameters of the neurons (see neuron.presets): None = Neuron.params everywhere;
+                          a preset name or dictionary for every layer; a dictionary {'input' | 'pain' | 'hidden' |
+                          'output' : parameters} for some layer types (e.g. {'pain' : 'FS'}); or a list with the
+                          parameters of each layer, in the order of neurons.  A layer's parameters may also list one
+                          preset per neuron (see neuron.paramArrays).
+        maxI            - largest input current of a neuron (inputs saturate at it) and largest weight; initial
+                          weights are drawn from [0, maxI).  Only the vectorized network can differ from synapse.maxI.
+        gated           - True to only integrate the neurons that have input or are still relaxing, and to only
+                          compute currents from the neurons with a spike in flight (vectorized only); neurons at or
+                          near rest follow a shared resting trajectory and are caught up when input arrives
+                          (Population.updates counts the neuron updates actually integrated, Population.settleTol
+                          bounds the difference to integrating every neuron)
     """
-    def __init__(self, phaseDuration : int = 100, dt : float = 0.1, structure : list = [2, 1, 1], simStep : int = 0):
+    def __init__(self, phaseDuration : int = 100, dt : float = 0.1, structure : list = [2, 1, 1], simStep : int = 0,
+                 vectorized : bool = True, kernel : str = 'table', recordSpikes : bool = False,
+                 recordState : tuple = ('v',), recordEvery : int = 1, backend : str = 'numpy',
+                 adaptive : bool = False, gated : bool = False, spikeShape : dict = None, weights : list = None,
+                 spikeFile : str = None, maxI : float = maxI, params = None, signedWeights : bool = False):
+        """
+            Builds the network (see the fields above).  weights optionally gives the initial (unsigned)
+            (post, pre) weight matrix of every connected pair of layers, in the order of projections;
+            by default every weight is drawn uniformly from [0, maxI).  With signedWeights the matrices are
+            the signed Projection.W matrices (negative from pain layers) and become the projections' W as they
+            are, without a copy (e.g. read-only memory maps, see checkpoint.load).
+        """
         self.phaseDuration = phaseDuration
         self.dt            = dt
         self.structure     = structure
-
+        self.vectorized    = vectorized
+        self.kernel        = kernel
+        self.recordState   = recordState
+        self.recordEvery   = recordEvery
+        self.learning      = None
+        self.decision      = None
+        self.stats         = None
+        self.backend       = getBackend(backend)
+        self.gated         = gated
+        self.maxI          = maxI
+        self.params        = params
+        self.spikeShape    = {'rt' : 2, 'ft' : 35, 'holdTime' : 0}
+        if spikeShape is not None:
+            self.spikeShape.update(spikeShape)
+        self.populations   = None
+        self.projections   = list()
 
         self.t             = list(map(lambda x: x * self.dt, range(0, int(self.phaseDuration / self.dt),1)))
         self.simStep       = simStep
+
+        if kernel not in ('table', 'recursive'):
+            raise ValueError('Illegal kernel: must be \'table\' or \'recursive\'')
+        if kernel == 'recursive' and not vectorized:
+            raise ValueError('The recursive kernel requires the vectorized network')
+        if gated and not vectorized:
+            raise ValueError('Activity gating requires the vectorized network')
+        if maxI != synapse.maxI and not vectorized:
+            raise ValueError('A maxI other than synapse.maxI requires the vectorized network')
+        if gated and adaptive:
+            raise ValueError('Activity gating and adaptive stepping cannot be combined')
+
+        self._initWeights  = None if weights is None else iter(weights)
+        self._signedWeights = signedWeights
         self.neurons       = self.buildNetwork(self.structure)
+        self._initWeights  = None
+
+        self.raster        = None
+        self.recorders     = None
+        if recordSpikes:
+            self.raster = RasterRecorder(sum(len(layer) for layer in self.neurons), path=spikeFile)
+            offsets = np.cumsum([0] + [len(layer) for layer in self.neurons])
+            self.recorders = [self.raster.layer(int(offset), len(layer)) for offset, layer in zip(offsets, self.neurons)]
+            for layer, recorder in zip(self.neurons, self.recorders):
+                if self.vectorized:
+                    layer[0].population.record(recorder)
+                else:
+                    for i, neu in enumerate(layer):
+                        neu.record(recorder, i)
+
+        if self.vectorized:
+            for layer in range(len(self.populations)):
+                self.record(layer, variables=recordState, every=recordEvery)
+
+        self.adaptive      = AdaptiveStepper(self) if adaptive else None
 
     
     def buildNetwork(self, structure : list):
@@ -45,41 +156,62 @@ class Network(object):
         # find the number of hidden layers
         numHideLays = len(structure) - 3
 
-        Ins     = [Neuron(type=1)] * numIns     # 1 = input neuron
-        Pains   = [Neuron(type=-1)] * numPains  # -1 = pain neuron
-        Outs    = [Neuron(type=0)] * numOuts    # 0 = output neuron    
+        # layer sizes and types in simulation order [inputs, pain, hl1, hl2, ..., output]
+        sizes = [numIns, numPains] + list(structure[3:]) + [numOuts]
+        types = [1, -1] + [2] * numHideLays + [0]   # 1 = input, -1 = pain, 2 = hidden, 0 = output
 
-        neurons = [Ins, Pains]
-        
-        # Add in hidden layers
-        i = 3
-        while i < len(structure):
-            neurons.append([Neuron(type=2)] * structure[i]) # 2 = hidden neuron
-            i = i + 1
-                
-        # add in the outputs as the last layer
-        neurons.append(Outs)
+        params = self._layerParams(types)
+
+        if self.vectorized:
+            # each layer is a Population; the Neurons are views onto its arrays
+            self.populations = [Population(size=size, type=type, params=layerParams, backend=self.backend,
+                                           gated=self.gated, maxI=self.maxI)
+                                for size, type, layerParams in zip(sizes, types, params)]
+            neurons = [pop.neurons() for pop in self.populations]
+        else:
+            neurons = list()
+            for size, type, layerParams in zip(sizes, types, params):
+                a, b, c, d = paramArrays(layerParams, size)
+                neurons.append([Neuron(type=type, recordV='v' in self.recordState,
+                                       params={'a' : float(a[i]), 'b' : float(b[i]), 'c' : float(c[i]),
+                                               'd' : float(d[i])})
+                                for i in range(size)])
 
         # define the spike shape
-        ispikeTotal = funcs.ispike(dt=self.dt)
-        ispikeshape = ispikeTotal['current']
+        ispikeshape = funcs.ispikeKernel(dt=self.dt, **self.spikeShape)   # shared by every synapse with this shape
+        self.recursiveKernel = RecursiveKernel(dt=self.dt, **self.spikeShape) if self.kernel == 'recursive' else None
 
         # connect all the input neurons to the pain neurons
         self.fillConnects(fromLayer=neurons[0], toLayer=neurons[1], ispike=ispikeshape)
         
-        if numHideLays > 0:
-            # connect all the input and pain neurons to the first hidden layer, if it exists
-            self.fillConnects(fromLayer=neurons[0], toLayer=neurons[2], ispike=ispikeshape)
-            self.fillConnects(fromLayer=neurons[1], toLayer=neurons[2], ispike=ispikeshape)
+        # connect all the input and pain neurons to the first hidden layer (the outputs if there is none)
+        self.fillConnects(fromLayer=neurons[0], toLayer=neurons[2], ispike=ispikeshape)
+        self.fillConnects(fromLayer=neurons[1], toLayer=neurons[2], ispike=ispikeshape)
 
-            # fill in the rest of the layers
-            layer = 2 # 0th hidden layer
-            while layer - 1 < numHideLays:
-                self.fillConnects(fromLayer=neurons[layer], toLayer=neurons[layer + 1], ispike=ispikeshape)
-                layer = layer + 1
+        # fill in the rest of the layers, the last hidden layer feeds the outputs
+        layer = 2 # 0th hidden layer
+        while layer - 2 < numHideLays:
+            self.fillConnects(fromLayer=neurons[layer], toLayer=neurons[layer + 1], ispike=ispikeshape)
+            layer = layer + 1
 
         return neurons
     
+    def _layerParams(self, types : list) -> list:
+        """
+            Parameters of each layer (see the params field), from the layer types in simulation order
+        """
+        names = {1 : 'input', -1 : 'pain', 2 : 'hidden', 0 : 'output'}
+        params = self.params
+        if params is None:
+            return [Neuron.params] * len(types)
+        if isinstance(params, dict) and len(params) > 0 and set(params) <= set(names.values()):
+            return [params.get(names[type], Neuron.params) for type in types]
+        if isinstance(params, (str, dict)):
+            return [params] * len(types)
+        if len(params) != len(types):
+            raise ValueError('Got parameters for {} layers, expected {}'.format(len(params), len(types)))
+        return list(params)
+
     def fillConnects(self, fromLayer : list, toLayer : list, ispike : list):
         """
             initializes all connections from neurons in fromLayer to neurons in toLayer
@@ -92,13 +224,53 @@ class Network(object):
                 None
         """
 
-        # Connect the layers
-        for fromNeu in fromLayer:
-            for toNeu in toLayer:
-                # fromNeu is the presynaptic connection of the toNeu
-                fromNeu.connect(toNeu, 0)
-        
+        if len(fromLayer) == 0 or len(toLayer) == 0:
+            return
+
+        W = None
+        if self._initWeights is not None and self._signedWeights and self.vectorized:
+            # used as is: no unsigned copy
+            W, weights = next(self._initWeights), None
+        elif self._initWeights is not None:
+            weights = np.asarray(next(self._initWeights), dtype=float).reshape(len(toLayer), len(fromLayer))
+            if self._signedWeights:
+                weights = np.abs(weights)
+        else:
+            # every weight of the layer pair in one draw: the same numbers, in the same order, as one
+            # random.random() per synapse (presynaptic neuron outer, postsynaptic neuron inner)
+            weights = funcs.randomUniform(len(fromLayer) * len(toLayer)) * self.maxI
+            weights = weights.reshape(len(fromLayer), len(toLayer)).T
+
+        if self.vectorized:
+            # one weight matrix for the layer pair; Synapse objects are only made on demand (NeuronView.inSyns/outSyns)
+            if self.kernel == 'recursive':
+                ispike = self.recursiveKernel
+            self.projections.append(Projection(pre=fromLayer[0].population, post=toLayer[0].population,
+                                               weights=weights, ispike=ispike, W=W))
+        else:
+            # Connect the layers
+            for i, fromNeu in enumerate(fromLayer):
+                for j, toNeu in enumerate(toLayer):
+                    # fromNeu is the presynaptic connection of the toNeu
+                    fromNeu.connect(toNeu, 0, ispike=ispike, weight=float(weights[j, i]))
+
     
+    def record(self, layer : int, variables : tuple = ('v',), indices : list = None, every : int = 1):
+        """
+            Selects what gets recorded for one layer (vectorized only); replaces any previous recording of that layer
+            Inputs:
+                layer       - index into neurons [inputs, pain, hl1, hl2, ..., output]
+                variables   - which of 'v', 'u', 'I' to record; () records nothing
+                indices     - which neurons of the layer to record (None = all)
+                every       - decimation factor, one sample every `every` steps
+            Outputs:
+                the StateRecorder for the layer (None if nothing is recorded)
+        """
+        if not self.vectorized:
+            raise RuntimeError('Per layer recording needs the vectorized network')
+
+        return self.populations[layer].recordState(numSteps=len(self.t), variables=variables, indices=indices, every=every)
+
     def drawNetwork(self):
         """
             Draws the Network diagram
@@ -106,28 +278,234 @@ class Network(object):
         for i in self.neurons:
             print(len(i))
 
-    def step(self, I_in : list):
+    def _layerCurrent(self, pop : Population, simStep : int, I_in, I_pain, acts : dict) -> np.ndarray:
+        """
+            Input current of one layer at simStep
+            Inputs:
+                pop     - the layer's Population
+                simStep - simulation time index
+                I_in    - currents of the input neurons
+                I_pain  - external currents of the pain neurons
+                acts    - presynaptic activations already computed for this simStep (filled in as needed)
+        """
+        if pop.type == 1:
+            return np.asarray(I_in, dtype=float)
+
+        # Sum the weighted currents of every projection into this layer
+        I = np.zeros(pop.size)
+        for proj in self.projections:
+            if proj.post is pop:
+                # gated: a layer without spikes in flight drives no current (a recursive kernel never quite decays
+                # to 0, so it is always computed)
+                if proj.pre.gated and not isinstance(proj.ispikeShape, RecursiveKernel) \
+                        and not proj.pre.inFlight(simStep):
+                    continue
+                key = (id(proj.pre), id(proj.ispikeShape))
+                if key not in acts:
+                    acts[key] = proj.pre.activation(simStep = simStep, ispike = proj.ispikeShape)
+                I = I + proj.current(acts[key])
+        if pop.type == -1:
+            I = I + I_pain
+
+        return I
+
+    def step(self, I_in : list, I_pain : list = 0, steps : int = None):
         """
             Advance the network 1 step in the simulation.
             In other words, solve the whole network for the current simStep, then increment to the next step
             Inputs:
-                I_in - currents derived from the input strength, list of flaots
+                I_in   - currents derived from the input strength, list of floats (one per input neuron)
+                I_pain - external currents injected into the pain neurons, list of floats (or a single float)
+                steps  - advance at most this many steps (None = to the end of the phase); a later call resumes
 
         """
-        while self.simStep < len(self.t):
+        if self.adaptive is not None and self.learning is not None:
+            raise RuntimeError('Adaptive stepping does not support online learning')
+
+        end = len(self.t) if steps is None else min(len(self.t), self.simStep + steps)
+        decided = False
+        stats = self.stats
+        while self.simStep < end:
+            if stats is not None:
+                stepStart = perf_counter()
+
+            if self.adaptive is not None:
+                # take a long step if the dynamics are slow enough
+                skipped = self.adaptive.advance(I_in, I_pain, end)
+                if skipped > 0:
+                    # no spikes in a long step, but the decision rule may still settle at any step within it
+                    for simStep in range(self.simStep, self.simStep + skipped):
+                        decided = self.decision is not None and self.decision.update(simStep)
+                        if decided:
+                            break
+                    self.simStep = self.simStep + skipped
+                    if stats is not None:
+                        stats.step(stepStart, perf_counter())
+                    if decided:
+                        break
+                    continue
             
             # Solve all the neurons, starting with the input layer and moving forward
-            for layer in self.neurons:
-                for neu in layer:
-                    neu.step(simStep = self.simStep, dt = self.dt, I_in = I_in )
-                    # Neurons will call synapses to find their input current
+            if self.vectorized:
+                acts = dict()   # presynaptic activation of each layer, computed once per step
+                spiked = list() # which neurons of each layer spiked this step
+                for i, pop in enumerate(self.populations):
+                    if stats is not None:
+                        start = perf_counter()
+                    I = self._layerCurrent(pop, self.simStep, I_in, I_pain, acts)
+                    if stats is not None:
+                        mid = perf_counter()
+                    spiked.append(pop.step(simStep = self.simStep, dt = self.dt, I = I))
+                    if stats is not None:
+                        stats.layer(i, start, mid, perf_counter(), spiked[-1])
+
+                if self.learning is not None:
+                    self.learning.step(spiked)
+            else:
+                for layer in self.neurons:
+                    for i, neu in enumerate(layer):
+                        if neu.type == 1:
+                            neu.step(simStep = self.simStep, dt = self.dt, I_in = np.broadcast_to(I_in, len(layer))[i])
+                        else:
+                            neu.step(simStep = self.simStep, dt = self.dt, I_in = np.broadcast_to(I_pain, len(layer))[i])
+                        # Neurons will call synapses to find their input current
 
 
             # increment to next simulation step
             self.simStep = self.simStep + 1
-        
-            
-        
+
+            decided = self.decision is not None and self.decision.update(self.simStep - 1)
+            if stats is not None:
+                stats.step(stepStart, perf_counter())
+            if decided:
+                # every sample has its winner, no need to simulate the rest of the phase
+                break
+
+        if self.raster is not None:
+            self.raster.flush()
+
+        if self.gated:
+            # complete the state of the neurons still at rest
+            for pop in self.populations:
+                pop.sync(self.simStep, self.dt)
+
+        if self.simStep < len(self.t) and not decided:
+            # stopped part way through the phase
+            return
+
+        self.endPhase()
+
+    def endPhase(self):
+        """
+            Closes the phase: applies the learning updates kept for the end of the phase and settles the samples left
+            undecided (called by step at the end of the phase; call it to end a phase early)
+        """
+        if self.learning is not None:
+            self.learning.endPhase()
+        if self.decision is not None:
+            self.decision.endPhase()
+
+    def reset(self, batch : int = None):
+        """
+            Puts every neuron back in its initial state and rewinds the simulation to simStep 0 (vectorized only).
+            The state arrays are reused when the batch size is unchanged.
+            Inputs:
+                batch - number of independent samples to simulate from now on (None = unbatched)
+        """
+        if not self.vectorized:
+            raise RuntimeError('reset needs the vectorized network')
+
+        for pop in self.populations:
+            pop.reset(batch=batch)
+        if self.learning is not None:
+            self.learning.reset()
+        if self.adaptive is not None:
+            self.adaptive.reset()
+        if self.decision is not None:
+            self.decision.reset()
+        self.simStep = 0
+
+    def nextPhase(self):
+        """
+            Starts the next phase of the current sample: rewinds simStep to 0 but keeps the network state, so the
+            new phase continues the dynamics of the last one (spikes still in flight keep driving their synapses).
+            Spike counts, first spikes and decisions start over; raster steps keep counting (vectorized only).
+        """
+        if not self.vectorized:
+            raise RuntimeError('nextPhase needs the vectorized network')
+
+        elapsed = self.simStep
+        for pop in self.populations:
+            pop.newPhase(elapsed)
+        if self.raster is not None:
+            self.raster.stepOffset = self.raster.stepOffset + elapsed
+        if self.decision is not None:
+            self.decision.reset()
+        self.simStep = 0
+
+    def close(self):
+        """
+            Flushes and closes the spike raster file (spikeFile), if any; the raster can still be queried.  Also
+            called on leaving a `with Network(...) as net:` block.
+        """
+        if self.raster is not None:
+            self.raster.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, I_in : np.ndarray, I_pain : np.ndarray = 0) -> dict:
+        """
+            Simulates a batch of independent samples for one phase.  The samples share the weights,
+            every sample has its own neuron state.  The spike raster (recordSpikes) only records a single sample:
+            with it, a batch of one sample runs unbatched (its raster steps following on from the previous run) and
+            larger batches are rejected.
+            Inputs:
+                I_in   - input currents, (batch, inputs) array (one row per sample)
+                I_pain - external pain currents, (batch, pain neurons) array or a single float
+            Outputs:
+                dictionary with, for every sample and output neuron,
+                    counts     - (batch, outputs) number of output spikes
+                    firstSpike - (batch, outputs) time index of the first output spike (-1 = no spike)
+                    firstTime  - (batch, outputs) time (in ms) of the first output spike (nan = no spike)
+                and, with a decision rule,
+                    winner       - (batch,) index of the winning output neuron (-1 = no output spiked)
+                    decisionTime - (batch,) time (in ms) at which the sample was decided (nan = end of phase reached)
+                    steps        - number of steps simulated (the phase stops once every sample is decided)
+        """
+        I_in = np.asarray(I_in, dtype=float)
+        if I_in.ndim == 1:
+            I_in = I_in[None, :]
+        batch = I_in.shape[0]
+
+        if self.raster is None:
+            self.reset(batch=batch)
+        elif batch == 1:
+            # keep the raster on one time line across runs
+            self.raster.stepOffset = self.raster.stepOffset + self.simStep
+            self.reset()
+            I_in = I_in[0]
+            if np.ndim(I_pain) == 2:
+                I_pain = np.asarray(I_pain)[0]
+        else:
+            raise ValueError('The spike raster (recordSpikes) only records batches of one sample, got {}'.format(batch))
+        self.step(I_in=I_in, I_pain=I_pain)
+
+        out = self.populations[-1]
+        result = {'counts'     : out.spikeCount.reshape(batch, -1).copy(),
+                  'firstSpike' : out.firstSpike.reshape(batch, -1).copy()
+                  }
+        result['firstTime'] = np.where(result['firstSpike'] >= 0, result['firstSpike'] * self.dt, np.nan)
+        if self.decision is not None:
+            decisionStep = self.decision.decisionStep.reshape(batch)
+            result['winner'] = self.decision.winner.reshape(batch).copy()
+            result['decisionTime'] = np.where(decisionStep >= 0, decisionStep * self.dt, np.nan)
+            result['steps'] = self.simStep
+
+        return result
 
 
 def simTick():
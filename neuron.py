@@ -3,6 +3,8 @@
 # IEEE Transactions on neural networks 14.6 (2003): 1569-1572
 
 from math import pow
+from bisect import bisect_right
+from array import array
 import random
 import numpy
 from synapse import maxI
@@ -14,43 +16,131 @@ _OUTPUT = 0
 _HIDDEN = 2
 _PAIN = -1
 
+# Izhikevich parameter presets (Izhikevich 2003, fig. 2)
+presets = {'RS'  : {'a' : 0.02, 'b' : 0.2,  'c' : -65, 'd' : 8},    # Regular Spiking (excitatory cortical)
+           'IB'  : {'a' : 0.02, 'b' : 0.2,  'c' : -55, 'd' : 4},    # Intrinsically Bursting
+           'CH'  : {'a' : 0.02, 'b' : 0.2,  'c' : -50, 'd' : 2},    # CHattering (fast rhythmic bursting)
+           'FS'  : {'a' : 0.1,  'b' : 0.2,  'c' : -65, 'd' : 2},    # Fast Spiking (inhibitory)
+           'LTS' : {'a' : 0.02, 'b' : 0.25, 'c' : -65, 'd' : 2}}    # Low-Threshold Spiking (inhibitory)
+
+
+def neuronParams(params) -> dict:
+    """
+        Izhikevich parameters of a preset name ('RS', 'IB', 'CH', 'FS', 'LTS') or a dictionary with a, b, c and d
+    """
+    if isinstance(params, str):
+        if params not in presets:
+            raise ValueError('Unknown neuron preset {}: must be one of {}'.format(params, ', '.join(presets)))
+        return dict(presets[params])
+
+    missing = {'a', 'b', 'c', 'd'} - set(params)
+    if len(missing) > 0:
+        raise ValueError('Missing neuron parameters: {}'.format(', '.join(sorted(missing))))
+    return params
+
+
+def paramArrays(params, size : int) -> tuple:
+    """
+        Izhikevich parameter arrays of a group of size neurons
+        Inputs:
+            params - a preset name or dictionary for every neuron (dictionary values may also be arrays with one entry
+                     per neuron), or a list with one preset name / dictionary per neuron
+        Outputs:
+            (a, b, c, d) - contiguous float arrays of length size
+    """
+    if isinstance(params, (str, dict)):
+        params = neuronParams(params)
+        values = [params[key] for key in 'abcd']
+    else:
+        if len(params) != size:
+            raise ValueError('Got parameters for {} neurons, expected {}'.format(len(params), size))
+        params = [neuronParams(p) for p in params]
+        values = [[p[key] for p in params] for key in 'abcd']
+
+    return tuple(numpy.array(numpy.broadcast_to(numpy.asarray(value, dtype=float), (size,))) for value in values)
+
+
+def synapticCurrent(pre, ispike : numpy.ndarray, simStep : int) -> float:
+    """
+        Unweighted current of a synapse from neuron pre at this simulation step: the strongest value of the spike
+        shape ispike over pre's spikes in flight (negative if pre is a pain neuron)
+    """
+    synI = 0
+    spikes = pre.spikes
+    if len(spikes) != 0:
+        # retrieve spikes from the preneuron, skipping the ones too old to contribute
+        first = bisect_right(spikes, simStep - len(ispike))
+        for spike in spikes[first:]:
+            if spike > simStep:
+                break
+            # Possible overlapping spikes
+            # Find whichever current value in spike is strongest
+            if ispike[int(simStep-spike)] > synI:
+                synI = ispike[int(simStep-spike)]
+
+    # see if the previous neuron is a pain neuron. If it is, current counts as a negative
+    if pre.type == -1:
+        synI = -1 * synI
+
+    return synI
+
+
 class Neuron(object):
     #connects = []    # Neuron connections
     #pot = []            # membrane potential
-    params = {}
-    # Regular Spiking Params
-    params['a'] = 0.02
-    params['b'] = 0.2
-    params['c'] = -65
-    params['d'] = 8
+    # fixed attributes (no per instance __dict__)
+    __slots__ = ('vnow', 'v', 'inPre', 'inWeights', 'inShapes', 'inShapeIdx', 'inLinked', 'outPost', 'u', 'type',
+                 'spikes', 'spikeWindow', 'recorder', 'recorderIndex', 'a', 'b', 'c', 'd')
+
+    # Default (Regular Spiking) Params; a copy, so tuning them leaves the RS preset alone
+    params = dict(presets['RS'])
     
-    def __init__(self, type : int):
-        self.v = list()
-        #self.v = list()
-        self.v.append(self.params['c']) # membrane potential in millivolts
-        self.inSyns = set()             # input synapses
-        self.outSyns = set()            # output synapses
-        self.u = self.params['b'] * self.v[0]
+    def __init__(self, type : int, recordV : bool = True, params = None):
+        """
+            params - Izhikevich parameters of this neuron, a preset name or a dictionary (see neuronParams);
+                     None = the class default, Neuron.params
+        """
+        params = self.params if params is None else neuronParams(params)
+        self.a = params['a']            # Izhikevich parameters, kept as attributes (no dictionary lookups per step)
+        self.b = params['b']
+        self.c = params['c']
+        self.d = params['d']
+        self.vnow = self.c              # membrane potential in millivolts
+        self.v = None                   # membrane potential history (None = not recorded)
+        if recordV:
+            self.v = [self.vnow]
+        # synapses, as arrays in the order they were connected (Synapse objects are made on demand, see inSyns)
+        self.inPre = list()             # presynaptic neuron of each input synapse
+        self.inWeights = array('d')     # weight of each input synapse
+        self.inShapes = list()          # distinct current spike shapes of the input synapses
+        self.inShapeIdx = array('H')    # current spike shape of each input synapse (index into inShapes)
+        self.inLinked = bytearray()     # 1 for the input synapses registered with their presynaptic neuron
+        self.outPost = list()           # postsynaptic neuron of each output synapse
+        self.u = self.b * self.vnow
         self.type = type                # 0 = output, 1 = input, 2 = hidden, -1 = pain
         
 
-        self.spikes = list()            # list of times when a spike occurred
+        self.spikes = list()            # list of recent times when a spike occurred (those that can still drive a synapse)
+        self.spikeWindow = 1            # number of steps a spike is kept in self.spikes (longest output spike shape)
+        self.recorder = None            # optional SpikeRecorder keeping the full spike history
+        self.recorderIndex = 0          # this neuron's index in the recorder
 
         
 
     """     Private Functions   """
     def _calcI(self, simStep : int, dt : float = 0.1):
         """
-            Calculates the input current I based on the synapses.  Weighting happens in the synapses.
-            This will compute the sum of all the weighted inputs from the synapses
+            Calculates the input current I based on the synapses.
+            This will compute the sum of all the weighted inputs from the synapses (same as Synapse.step for each)
         
             Inputs:
                 simStep - simulation time index (timestamp)
                 dt      - time step in (ms)
         """
         totalI = 0
-        for syn in self.inSyns:
-            totalI = totalI + syn.step(simStep = simStep)
+        shapes = self.inShapes
+        for pre, weight, shape in zip(self.inPre, self.inWeights, self.inShapeIdx):
+            totalI = totalI + synapticCurrent(pre, shapes[shape], simStep) * weight
         
         return totalI
     
@@ -77,26 +167,82 @@ class Neuron(object):
         if I > maxI:
             I = maxI
 
-        vnow = self.v[simStep] # current membrane potential
+        vnow = self.vnow # current membrane potential
         dv = (0.04 * pow(vnow,2) + 5 * vnow + 140 - self.u + I) * dt
-        du = (self.params['a'] * (self.params['b']*vnow - self.u)) * dt
+        du = (self.a * (self.b*vnow - self.u)) * dt
 
         # Adjust the variables
-        self.v.append(vnow + dv)
+        self.vnow = vnow + dv
         self.u = self.u + du
 
         # Reset if needed
-        if self.v[-1] >= 30:
-            self.v[-1] = self.params['c']
-            self.u = self.u + self.params['d']
+        if self.vnow >= 30:
+            self.vnow = self.c
+            self.u = self.u + self.d
             self.spikes.append(simStep)
 
+            # Forget the spikes that can no longer drive a synapse
+            if simStep - self.spikes[0] >= self.spikeWindow:
+                del self.spikes[:bisect_right(self.spikes, simStep - self.spikeWindow)]
+
+            if self.recorder is not None:
+                self.recorder.record(self.recorderIndex, simStep)
+
+        if self.v is not None:
+            self.v.append(self.vnow)
+
+    @property
+    def inSyns(self) -> list:
+        """
+            Input synapses, in the order they were connected (made on demand from the input arrays)
+        """
+        from synapse import Synapse
+        return [Synapse.at(self, k) for k in range(len(self.inPre))]
+
+    @property
+    def outSyns(self) -> list:
+        """
+            Output synapses, by postsynaptic neuron in the order they were connected (made on demand from the
+            postsynaptic neurons' input arrays)
+        """
+        from synapse import Synapse
+        syns = list()
+        for post in dict.fromkeys(self.outPost):
+            syns.extend(Synapse.at(post, k) for k, pre in enumerate(post.inPre) if pre is self and post.inLinked[k])
+        return syns
+
+    @property
+    def spikeHistory(self) -> list:
+        """
+            Every spike time of this neuron (needs a recorder, see record)
+        """
+        if self.recorder is None:
+            raise RuntimeError('Spike history is not recorded for this neuron; call record() first')
+
+        return self.recorder.spikes(self.recorderIndex)
+
+    def record(self, recorder = None, index : int = 0):
+        """
+            Keeps the full spike history of this neuron in a SpikeRecorder
+            Inputs:
+                recorder - SpikeRecorder to record into (a new one for just this neuron if None)
+                index    - this neuron's index in the recorder
+        """
+        if recorder is None:
+            from recorder import SpikeRecorder
+            recorder = SpikeRecorder(1)
+            index = 0
+
+        self.recorder = recorder
+        self.recorderIndex = index
         
 
     def regSynapse(self, syn, IO : int):
         """
         Registers a new synaptic connection as either an input (1) or output (0) synapse connection to this neuron.
-        Adds to self.inSyns or self.outSyns, after checking to see if it's already been registered.
+        An input gets a new entry in the input arrays (its weight and spike shape start as 0 and None; the Synapse
+        sets them), an output one in outPost, after checking to see if it's already been registered.
+        Registering as an output first registers the synapse with its postsynaptic neuron if needed.
 
         Inputs:
             syn - Synapse to be registered
@@ -105,13 +251,40 @@ class Neuron(object):
         """
 
         if IO == 1:
-            self.inSyns.add(syn)
+            if syn.index is not None:
+                # already registered
+                return
+            syn.index = len(self.inPre)
+            self.inPre.append(syn.pre)
+            self.inWeights.append(0)
+            self.inShapeIdx.append(self.shapeIndex(None))
+            self.inLinked.append(0)
         elif IO == 0:
-            self.outSyns.add(syn)
+            if syn.index is None:
+                syn.post.regSynapse(syn, 1)
+            if syn.post.inLinked[syn.index]:
+                # already registered
+                return
+            syn.post.inLinked[syn.index] = 1
+            self.outPost.append(syn.post)
+            if syn.ispikeShape is not None:
+                # keep spikes as long as they can drive this synapse
+                self.spikeWindow = max(self.spikeWindow, len(syn.ispikeShape))
         else:
             raise ValueError('Illegal value for IO: must be 1 (if neuron is postsynaptic) or 0 (presynaptic)')
 
 
+    def shapeIndex(self, ispike) -> int:
+        """
+            Index of a current spike shape in inShapes (the same array object, not an equal one), added if new
+        """
+        for k, shape in enumerate(self.inShapes):
+            if shape is ispike:
+                return k
+
+        self.inShapes.append(ispike)
+        return len(self.inShapes) - 1
+
     def connect(self, toNeuron, prePost : int, ispike : list, weight : float = -256):
         """
             Registers a connection between this Neuron and another Neuron
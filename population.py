@@ -0,0 +1,676 @@
+# This file contains the population class
+# A population stores the state of a whole layer of Izhikevich neurons as arrays
+# (struct-of-arrays) so the layer can be advanced in one vectorized operation.
+# Adapted From: Izhikevich, Eugene M. "Simple model of spiking neurons."
+# IEEE Transactions on neural networks 14.6 (2003): 1569-1572
+
+import numpy as np
+from synapse import maxI
+from neuron import Neuron, paramArrays
+from kernel import RecursiveKernel
+from recorder import SpikeRecorder, StateRecorder
+from backend import NumpyBackend
+
+_NOSPIKE = -(2 ** 62)   # empty slot in the recent spike ring buffer (older than any spike window)
+_RESTCYCLE = 8          # longest cycle of the resting trajectory that is detected (in steps)
+
+
+class Population(object):
+    """
+        Layer of neurons that all share a type
+
+        Fields:
+        size        - number of neurons in the layer
+        type        - 0 = output, 1 = input, 2 = hidden, -1 = pain
+        a, b, c, d  - Izhikevich parameter arrays, one entry per neuron (from params: a preset name such as 'FS',
+                      a dictionary, or one of those per neuron, see neuron.paramArrays); neurons of different types
+                      share one vectorized step
+        maxI        - input current saturation
+        v           - membrane potential array (in millivolts)
+        u           - membrane recovery array
+                      (v, u and the other state arrays get a leading batch axis, (batch, size), when batch is set)
+        batch       - number of independent samples simulated at once (None = a single, unbatched sample)
+        spikeCount  - number of spikes of each neuron since the last reset
+        firstSpike  - time index of the first spike of each neuron since the last reset (-1 = none yet)
+        stateRecorder - optional StateRecorder for v/u/I (None = nothing recorded)
+        window      - number of steps a spike can still drive a synapse (longest spike shape fed by this layer)
+        recentSpikes- (size, slots) or (batch, size, slots) ring buffer of the most recent spike times of each neuron
+        recentPos   - next ring buffer slot to write for each neuron
+        recorder    - optional SpikeRecorder keeping the full spike history (None = not recorded)
+        filters     - RecursiveKernel states driven by this layer's spikes, {id(kernel) : (kernel, state)}
+        backend     - kernels used to integrate and to compute activations / currents (see backend.py)
+        gated       - True to only integrate the neurons that have input or are still relaxing (activity gating)
+        lastSpike   - time index of the latest spike of each neuron (_NOSPIKE = none)
+        pristine    - (gated) neurons that have had no input since the reset; they follow the resting trajectory
+                      and their entries of v and u are stale until sync() (or input arrives)
+        restOffset  - (gated) steps taken since the reset in the phases before the current one (see newPhase), i.e.
+                      the position on the resting trajectory of simStep 0
+        restLimit   - (gated) longest resting trajectory kept, in steps: once it is reached without the trajectory
+                      closing (see restCycle), the pristine neurons are integrated like the others
+        restCycle   - (gated) (start, period) once the resting trajectory of every group has reached a fixed point
+                      (period 1) or a cycle of up to _RESTCYCLE steps, after which it is not extended (None = not yet)
+        settled     - (gated) relaxing neurons that have joined the slow resting trajectory of their parameter group
+                      (within settleTol); skipped while they get no input, their v and u are stale until sync() or input
+        settlePos   - (gated) position of each settled neuron on its slow resting trajectory, minus the step it settled
+                      on (so the position at any later step is settlePos + that step, see _resume)
+        settleSide  - (gated) slow resting trajectory a settled neuron follows: 0 = recovery below rest, 1 = above
+        settleTol   - (gated) largest distance (in mV) of a neuron's v from the slow resting trajectory for it to settle
+        updates     - number of neuron updates integrated since the last reset (batch entries count separately)
+        inProjections  - Projections into this layer
+        outProjections - Projections out of this layer
+    """
+    def __init__(self, size : int, type : int, params = Neuron.params, backend = None, gated : bool = False,
+                 maxI : float = maxI, settleTol : float = 1e-3, restLimit : int = 4096):
+        self.size   = size
+        self.maxI   = maxI
+        self.type   = type
+        self.backend = backend if backend is not None else NumpyBackend()
+        self.gated  = gated
+        self.settleTol = settleTol
+        self.restLimit = restLimit
+
+        self.a, self.b, self.c, self.d = paramArrays(params, size)
+
+        self.stateRecorder = None
+        self.window       = 1
+        self.recorder     = None
+        self.filters      = dict()
+        self.inProjections  = list()
+        self.outProjections = list()
+        self._views       = None
+        self.batch        = None
+        self.v            = None
+        self._restKey     = None
+
+        self.reset()
+
+    def reset(self, batch : int = None):
+        """
+            Puts every neuron back in its initial (resting) state and forgets all spikes.  The state arrays are
+            overwritten in place when the batch size is unchanged (reallocated otherwise).
+            Inputs:
+                batch - number of independent samples to simulate from now on (None = unbatched)
+        """
+        if batch is not None and self.recorder is not None:
+            raise ValueError('Spike history recording does not support batches')
+
+        shape       = (self.size,) if batch is None else (batch, self.size)
+        if self.v is not None and self.batch == batch and self.v.shape == shape:
+            self._resetInPlace()
+            return
+
+        self.batch  = batch
+
+        self.v      = np.broadcast_to(self.c, shape).copy()
+        self.u      = self.b * self.v
+
+        self.spikeCount   = np.zeros(shape, dtype=np.int64)
+        self.firstSpike   = np.full(shape, -1, dtype=np.int64)
+        self.recentSpikes = np.full(shape + (4,), _NOSPIKE, dtype=np.int64)
+        self.recentPos    = np.zeros(shape, dtype=np.int64)
+        self.lastSpike    = np.full(shape, _NOSPIKE, dtype=np.int64)
+        self.pristine     = np.full(shape, self.gated)
+        self.settled      = np.zeros(shape, dtype=bool)
+        self.settlePos    = np.zeros(shape)
+        self.settleSide   = np.zeros(shape, dtype=np.int8)
+        self.updates      = 0
+        self._restStart(shape)
+
+        for key, (kernel, state) in self.filters.items():
+            self.filters[key] = (kernel, kernel.newState(shape))
+
+        if self.stateRecorder is not None:
+            rec = self.stateRecorder
+            self.recordState(numSteps=rec.numSteps, variables=rec.variables, indices=rec.indices, every=rec.every)
+
+    def setParams(self, params):
+        """
+            Replaces the Izhikevich parameters (preset name, dictionary, or one of those per neuron, see
+            neuron.paramArrays); reset() the layer (e.g. with Network.reset) before simulating on
+        """
+        self.a, self.b, self.c, self.d = paramArrays(params, self.size)
+
+    def _resetInPlace(self):
+        """
+            reset() for an unchanged batch size: overwrites the existing state arrays (and recordings) instead of
+            allocating new ones, so back to back samples only cost the simulation
+        """
+        self.v[...] = self.c
+        np.multiply(self.b, self.v, out=self.u)
+
+        self.spikeCount.fill(0)
+        self.firstSpike.fill(-1)
+        self.recentSpikes.fill(_NOSPIKE)
+        self.recentPos.fill(0)
+        self.lastSpike.fill(_NOSPIKE)
+        self.pristine.fill(self.gated)
+        self.settled.fill(False)
+        self.settlePos.fill(0)
+        self.settleSide.fill(0)
+        self.updates = 0
+        self._restStart(self.v.shape)
+
+        for kernel, state in self.filters.values():
+            for s in state:
+                s.fill(0)
+
+        if self.stateRecorder is not None:
+            self.stateRecorder.clear()
+            self.stateRecorder.sample(0, v=self.v, u=self.u, I=np.zeros(self.v.shape))
+
+    def newPhase(self, elapsed : int):
+        """
+            Starts a new phase without touching the dynamic state: the phase clock is rewound by elapsed steps
+            (spike times are shifted to match, in place) and the per phase spike counts are cleared
+            Inputs:
+                elapsed - number of steps taken in the phase that is ending
+        """
+        self.recentSpikes -= elapsed
+        self.lastSpike -= elapsed
+        self.restOffset = self.restOffset + elapsed
+        self.spikeCount.fill(0)
+        self.firstSpike.fill(-1)
+
+    def step(self, simStep : int, dt : float, I : np.ndarray):
+        """
+            Time step for the whole layer, update model variables
+            Inputs:
+                simStep = simulation time index (integer)
+                dt      = time step (in ms)
+                I       = input current, one entry per neuron (or a scalar)
+            Outputs:
+                boolean array, True for the neurons that spiked this step
+        """
+        # Saturation Check
+        I = np.broadcast_to(np.clip(I, 0, self.maxI), self.v.shape)
+
+        if self.gated:
+            fired = self._stepGated(simStep, dt, I)
+        else:
+            self.v, self.u, fired = self.backend.integrate(self.v, self.u, self.a, self.b, self.c, self.d, I, dt)
+            self.updates = self.updates + self.v.size
+
+        if fired.any():
+            idx = np.nonzero(fired)
+            self.spikeCount[idx] += 1
+            self.firstSpike[idx] = np.where(self.firstSpike[idx] < 0, simStep, self.firstSpike[idx])
+            self._pushSpikes(idx, simStep)
+            if self.recorder is not None:
+                self.recorder.record(idx[0], simStep)
+
+        if self.stateRecorder is not None:
+            # sample k is the state after k steps
+            if self.gated and (simStep + 1) % self.stateRecorder.every == 0:
+                self.sync(simStep + 1, dt)
+            self.stateRecorder.sample(simStep + 1, v=self.v, u=self.u, I=I)
+
+        for kernel, state in self.filters.values():
+            kernel.update(state, fired)
+
+        return fired
+
+    def _restStart(self, shape : tuple):
+        """
+            Groups the neurons by parameter set and starts the resting trajectory (the state after k steps without
+            input, from the reset state) of each group
+        """
+        params = np.stack([self.a, self.b, self.c, self.d], axis=-1)
+        self.restOffset = 0
+        if self._restKey is not None and np.array_equal(self._restKey, params):
+            # same parameters as before: the trajectory computed so far still holds
+            return
+
+        self._restKey = params
+        params, self.restGroup = np.unique(params, axis=0, return_inverse=True)
+        self.restGroup = self.restGroup.reshape(-1)
+        self.restParams = params.T
+        self.restV = [np.array(params[:, 2])]
+        self.restU = [params[:, 1] * params[:, 2]]
+        self.restFired = [np.zeros(len(params), dtype=bool)]
+        self.restCycle = None
+        self.slowRest  = None
+
+    def _restIndex(self, step : int) -> int:
+        """
+            Entry of the resting trajectory that holds the state at step (past the start of a cycle, its matching
+            step within the first period)
+        """
+        if self.restCycle is not None and step > self.restCycle[0]:
+            start, period = self.restCycle
+            step = start + (step - start) % period
+
+        return step
+
+    def _rest(self, simStep : int, dt : float) -> tuple:
+        """
+            Resting trajectory at simStep, extended (with the layer's own backend, so the arithmetic matches step) as
+            needed, until it closes on a fixed point or a short cycle
+            Outputs:
+                (v, u, fired) - one entry per parameter group; fired is True if the group spikes in the step from simStep
+        """
+        a, b, c, d = self.restParams
+        while len(self.restV) <= self._restIndex(simStep + 1):
+            v, u, fired = self.backend.integrate(self.restV[-1], self.restU[-1], a, b, c, d, np.zeros(len(a)), dt)
+            self.restFired[-1] = fired
+            self.restV.append(v)
+            self.restU.append(u)
+            self.restFired.append(np.zeros(len(a), dtype=bool))
+
+            # the same state again: the trajectory repeats from here on
+            last = len(self.restV) - 1
+            for period in range(1, min(_RESTCYCLE, last) + 1):
+                if np.array_equal(v, self.restV[last - period]) and np.array_equal(u, self.restU[last - period]):
+                    self.restCycle = (last - period, period)
+                    break
+
+        step = self._restIndex(simStep)
+        return self.restV[step], self.restU[step], self.restFired[step]
+
+    def _slowRest(self, dt : float) -> dict:
+        """
+            Slow resting trajectories of the parameter groups: without input a relaxing neuron quickly (fast mode of
+            the linearized integrator) joins the trajectory that approaches the resting point along the slow mode,
+            from one side or the other.  Each one is run until it is within settleTol / 100 of rest, and only kept
+            from where the fast mode has decayed below settleTol / 100.
+            Groups whose resting point is not a stable node (e.g. a spiral, or no resting point) have none.
+            Outputs:
+                {(group, side) : (v, u)} - arrays indexed by position (steps along the trajectory), side 0 = recovery
+                                           below rest, 1 = above
+        """
+        if self.slowRest is not None and self.slowRest[0] == dt:
+            return self.slowRest[1]
+
+        tol = self.settleTol / 100
+        trajectories = dict()
+        for group, (a, b, c, d) in enumerate(self.restParams.T):
+            disc = (5 - b) ** 2 - 4 * 0.04 * 140
+            if disc <= 0:
+                continue
+            vRest = ((b - 5) - np.sqrt(disc)) / 0.08
+            uRest = b * vRest
+            gap = np.sqrt(disc) / 0.04     # distance to the unstable fixed point
+            J = np.array([[1 + (0.08 * vRest + 5) * dt, -dt], [a * b * dt, 1 - a * dt]])
+            lam, vecs = np.linalg.eig(J)
+            if np.iscomplexobj(lam) or not np.all((lam > 0) & (lam < 1)) or lam[0] == lam[1]:
+                continue
+            slow, fast = np.argmax(lam), np.argmin(lam)
+            slope = vecs[1, slow] / vecs[0, slow]
+
+            # recovery above rest: from as far as any input can drive it; below rest: close to rest on the slow
+            # mode, the unstable fixed point is not far (forward Euler as in the backends, in plain floats as the
+            # trajectories only need to hold to settleTol)
+            for v, u in ((vRest, uRest + 2 * self.maxI), (vRest + gap / 4, uRest + slope * gap / 4)):
+                skip = int(np.ceil(np.log(tol / max(abs(v - vRest), abs(u - uRest))) / np.log(lam[fast])))
+                vs, us, fired = [v], [u], False
+                while abs(v - vRest) > tol or abs(u - uRest) > tol:
+                    v, u = v + (0.04 * (v * v) + 5 * v + 140 - u) * dt, u + (a * (b * v - u)) * dt
+                    if v >= 30:
+                        fired = True
+                        break
+                    vs.append(v)
+                    us.append(u)
+                us = np.array(us[skip:])
+                if fired or len(us) < 2 or not (np.all(np.diff(us) > 0) or np.all(np.diff(us) < 0)):
+                    continue
+                trajectories[(group, int(us[0] > uRest))] = (np.array(vs[skip:]), us)
+
+        self.slowRest = (dt, trajectories)
+        return trajectories
+
+    def _slowPosition(self, group : np.ndarray, v : np.ndarray, u : np.ndarray, dt : float) -> tuple:
+        """
+            Where states (v, u) of neurons in parameter groups group lie on the slow resting trajectories
+            Outputs:
+                (near, pos, side) - True for the states within settleTol of a slow resting trajectory, their
+                                    position on it and its side (see _slowRest)
+        """
+        near = np.zeros(v.shape, dtype=bool)
+        pos = np.zeros(v.shape)
+        side = np.zeros(v.shape, dtype=np.int8)
+        for (g, s), (V, U) in self._slowRest(dt).items():
+            # U runs monotonically from U[0] towards rest (states past its end, within settleTol / 100, are placed
+            # at the end)
+            order = 1 if U[-1] > U[0] else -1
+            on = (group == g) & (order * u >= order * U[0]) & (order * (u - U[-1]) <= self.settleTol / 100)
+            if not on.any():
+                continue
+            pos[on] = np.interp(order * u[on], order * U, np.arange(len(U)))
+            near[on] = np.abs(v[on] - np.interp(pos[on], np.arange(len(V)), V)) <= self.settleTol
+            side[on] = s
+
+        return near, pos, side
+
+    def _settle(self, idx : tuple, step : int, dt : float):
+        """
+            Settles the neurons at idx (relaxing without input) that are within settleTol of the slow resting
+            trajectory of their group
+            Inputs:
+                step - position on the layer's time line (simStep + restOffset) of their current state
+        """
+        near, pos, side = self._slowPosition(self.restGroup[idx[-1]], self.v[idx], self.u[idx], dt)
+        if near.any():
+            sel = tuple(i[near] for i in idx)
+            self.settled[sel] = True
+            self.settlePos[sel] = pos[near] - step
+            self.settleSide[sel] = side[near]
+
+    def _resume(self, idx : tuple, step : int, dt : float):
+        """
+            Writes the state of the settled neurons at idx at the given position on the layer's time line
+            (simStep + restOffset), from their slow resting trajectories
+        """
+        group = self.restGroup[idx[-1]]
+        side = self.settleSide[idx]
+        pos = self.settlePos[idx] + step
+        for (g, s), (V, U) in self._slowRest(dt).items():
+            on = (group == g) & (side == s)
+            if on.any():
+                sel = tuple(i[on] for i in idx)
+                self.v[sel] = np.interp(pos[on], np.arange(len(V)), V)
+                self.u[sel] = np.interp(pos[on], np.arange(len(U)), U)
+
+    def _stepGated(self, simStep : int, dt : float, I : np.ndarray) -> np.ndarray:
+        """
+            Integrates only the neurons that have input, are relaxing, or would spike on the resting trajectory.
+            Pristine neurons are first caught up to the resting trajectory and settled ones to their slow resting
+            trajectory, so the result is the same as integrating every neuron (up to settleTol for settled ones).
+            Outputs:
+                boolean array, True for the neurons that spiked this step
+        """
+        driven = I != 0
+        step = simStep + self.restOffset
+        if self.pristine.any() and self.restCycle is None and step + 1 >= self.restLimit:
+            # the resting trajectory is still open (e.g. a spiral resting point): integrate the pristine neurons from
+            # here on rather than keep extending it
+            restV, restU, _ = self._rest(step, dt)
+            idx = np.nonzero(self.pristine)
+            self.v[idx] = restV[self.restGroup[idx[-1]]]
+            self.u[idx] = restU[self.restGroup[idx[-1]]]
+            self.pristine.fill(False)
+        if self.pristine.any():
+            restV, restU, restFired = self._rest(step, dt)
+            awake = driven | ~(self.pristine | self.settled) | (self.pristine & restFired[self.restGroup])
+        else:
+            awake = driven | ~self.settled
+
+        fired = np.zeros(self.v.shape, dtype=bool)
+        if awake.all():
+            # nothing to skip: integrate the whole layer
+            idx = (slice(None),) * self.v.ndim
+            col = slice(None)
+            count = self.v.size
+        elif awake.any():
+            idx = np.nonzero(awake)
+            col = idx[-1]
+            count = len(col)
+        else:
+            idx = None
+
+        if idx is not None:
+            # catch up the neurons that are waking from the resting trajectory
+            wake = self.pristine[idx]
+            if wake.any():
+                wakeIdx = np.nonzero(self.pristine & awake)
+                group = self.restGroup[wakeIdx[-1]]
+                self.v[wakeIdx] = restV[group]
+                self.u[wakeIdx] = restU[group]
+                self.pristine[idx] = False
+            resume = self.settled[idx]
+            if resume.any():
+                self._resume(np.nonzero(self.settled & awake), step, dt)
+                self.settled[idx] = False
+
+            vNew, uNew, fired[idx] = self.backend.integrate(self.v[idx], self.u[idx], self.a[col], self.b[col],
+                                                             self.c[col], self.d[col], I[idx], dt)
+            self.v[idx] = vNew
+            self.u[idx] = uNew
+            quiet = ~driven & ~fired & awake
+            if quiet.any():
+                self._settle(np.nonzero(quiet), step + 1, dt)
+            self.updates = self.updates + count
+
+        if self.pristine.any():
+            # the pristine neurons left join the slow resting trajectory once the resting trajectory has
+            restV, restU, _ = self._rest(step + 1, dt)
+            near, pos, side = self._slowPosition(np.arange(len(restV)), restV, restU, dt)
+            join = self.pristine & near[self.restGroup]
+            if join.any():
+                self.settled[join] = True
+                self.settlePos[join] = np.broadcast_to(pos[self.restGroup] - (step + 1), join.shape)[join]
+                self.settleSide[join] = np.broadcast_to(side[self.restGroup], join.shape)[join]
+                self.pristine[join] = False
+
+        return fired
+
+    def sync(self, simStep : int, dt : float):
+        """
+            Writes the resting trajectory at simStep into v and u for the pristine neurons, and the slow resting
+            trajectory for the settled ones (gated layers only), so the state arrays are complete
+        """
+        if not self.gated:
+            return
+
+        if self.pristine.any():
+            restV, restU, _ = self._rest(simStep + self.restOffset, dt)
+            idx = np.nonzero(self.pristine)
+            group = self.restGroup[idx[-1]]
+            self.v[idx] = restV[group]
+            self.u[idx] = restU[group]
+        if self.settled.any():
+            self._resume(np.nonzero(self.settled), simStep + self.restOffset, dt)
+
+    def inFlight(self, simStep : int) -> bool:
+        """
+            True if any neuron of the layer has a spike that can still drive a synapse at simStep
+        """
+        return bool(np.any(simStep - self.lastSpike < self.window))
+
+    def setState(self, v : np.ndarray, u : np.ndarray, simStep : int, I : np.ndarray = 0, start : int = None,
+                 Istart : np.ndarray = None):
+        """
+            Sets the state after a step taken outside of step() (e.g. a long adaptive step without spikes)
+            Inputs:
+                v, u    - new membrane potential and recovery
+                simStep - simulation time index the new state belongs to
+                I       - input current at the end of the step (for the state recording)
+                start   - time index of the state being replaced (None = simStep - 1).  The state recording gets the
+                          samples of the steps in between too, interpolated linearly from the old state to the new
+                          one, so it still has one sample per recorded step.
+                Istart  - input current at the start of the step, interpolated towards I (None = I throughout)
+        """
+        old = (self.v, self.u)
+        self.v = v
+        self.u = u
+
+        if self.stateRecorder is not None:
+            start = simStep - 1 if start is None else start
+            I = np.broadcast_to(I, self.v.shape)
+            Istart = I if Istart is None else np.broadcast_to(Istart, self.v.shape)
+            for step in range(start + 1, simStep + 1):
+                # sample k is the state after k steps, driven by the current of step k - 1
+                frac = (step - start) / (simStep - start)
+                Ifrac = (step - 1 - start) / (simStep - start)
+                self.stateRecorder.sample(step, v=old[0] + frac * (v - old[0]), u=old[1] + frac * (u - old[1]),
+                                          I=Istart + Ifrac * (I - Istart))
+
+    def _pushSpikes(self, idx : tuple, simStep : int):
+        """
+            Writes a spike at simStep into the ring buffer for each neuron in idx (tuple of index arrays, from np.nonzero).
+            The buffer is doubled if that would overwrite a spike that is still inside the window.
+        """
+        slots = self.recentPos[idx]
+        if np.any(simStep - self.recentSpikes[idx + (slots,)] < self.window):
+            self._growRing()
+            slots = self.recentPos[idx]
+
+        self.recentSpikes[idx + (slots,)] = simStep
+        self.recentPos[idx] = (slots + 1) % self.recentSpikes.shape[-1]
+        self.lastSpike[idx] = simStep
+
+    def _growRing(self):
+        """
+            Doubles the number of ring buffer slots, keeping every neuron's spikes oldest first
+        """
+        numSlots = self.recentSpikes.shape[-1]
+        order = (self.recentPos[..., None] + np.arange(numSlots)) % numSlots
+        ring = np.full(self.recentPos.shape + (2 * numSlots,), _NOSPIKE, dtype=np.int64)
+        ring[..., :numSlots] = np.take_along_axis(self.recentSpikes, order, axis=-1)
+
+        self.recentSpikes = ring
+        self.recentPos[:] = numSlots
+
+    def setWindow(self, window : int):
+        """
+            Makes sure spikes are kept for at least window steps (i.e. the length of a spike shape driven by this layer)
+        """
+        self.window = max(self.window, window)
+
+    def record(self, recorder : SpikeRecorder = None):
+        """
+            Starts keeping the full spike history of this layer in recorder (a new one if not given)
+            Outputs:
+                the SpikeRecorder
+        """
+        if recorder is None:
+            recorder = SpikeRecorder(self.size)
+        self.recorder = recorder
+
+        return recorder
+
+    def recordState(self, numSteps : int, variables : tuple = ('v',), indices : list = None, every : int = 1) -> StateRecorder:
+        """
+            Starts recording state variables of this layer into a preallocated StateRecorder
+            Inputs:
+                numSteps  - number of simulation steps to preallocate for
+                variables - which of 'v', 'u', 'I' to record (empty = record nothing)
+                indices   - which neurons to record (None = all)
+                every     - decimation factor, one sample every `every` steps
+            Outputs:
+                the StateRecorder (None if nothing is recorded)
+        """
+        if len(variables) == 0:
+            self.stateRecorder = None
+            return None
+
+        self.stateRecorder = StateRecorder(numSteps=numSteps, variables=variables, indices=indices, every=every)
+        self.stateRecorder.sample(0, v=self.v, u=self.u, I=np.zeros(self.v.shape))
+
+        return self.stateRecorder
+
+    def recent(self, index : int) -> list:
+        """
+            Most recent spike times of neuron number index, oldest first (of the first sample when batched)
+        """
+        ring = self.recentSpikes[index] if self.batch is None else self.recentSpikes[0, index]
+        return sorted(int(spike) for spike in ring if spike != _NOSPIKE)
+
+    def addFilter(self, kernel : RecursiveKernel):
+        """
+            Registers a RecursiveKernel so that its state gets updated by this layer's spikes every step
+        """
+        if id(kernel) not in self.filters:
+            self.filters[id(kernel)] = (kernel, kernel.newState(self.v.shape))
+
+    def activation(self, simStep : int, ispike : np.ndarray) -> np.ndarray:
+        """
+            Presynaptic activation of every neuron in the layer, i.e. the (unweighted) current spike value
+            each neuron is driving into its output synapses at this simulation step
+            Inputs:
+                simStep - simulation time index
+                ispike  - shape of the current spike, or a RecursiveKernel registered with addFilter
+            Outputs:
+                array of activations, one per neuron
+        """
+        if isinstance(ispike, RecursiveKernel):
+            return ispike.current(self.filters[id(ispike)][1])
+
+        # Only the spikes in the ring buffer can still contribute
+        return self.backend.activation(self.recentSpikes, simStep, ispike)
+
+    def neurons(self) -> list:
+        """
+            List of Neuron views, one (distinct) object per neuron in the layer (built on the first call)
+        """
+        if self._views is None:
+            self._views = [NeuronView(self, i) for i in range(self.size)]
+
+        return self._views
+
+
+class NeuronView(Neuron):
+    """
+        Neuron object backed by one entry of a Population.
+        Keeps the Neuron API (v, u, spikes, synapses) but the state lives in the population arrays.
+    """
+    __slots__ = ('population', 'index')
+
+    def __init__(self, population : Population, index : int):
+        self.population = population
+        self.index      = index
+        self.type       = population.type
+
+    @property
+    def v(self) -> list:
+        if self.population.stateRecorder is None:
+            raise RuntimeError('Membrane potential is not recorded for this layer')
+        return self.population.stateRecorder.trace('v', self.index).tolist()
+
+    @property
+    def a(self) -> float:
+        return float(self.population.a[self.index])
+
+    @property
+    def b(self) -> float:
+        return float(self.population.b[self.index])
+
+    @property
+    def c(self) -> float:
+        return float(self.population.c[self.index])
+
+    @property
+    def d(self) -> float:
+        return float(self.population.d[self.index])
+
+    @property
+    def vnow(self) -> float:
+        return float(self.population.v[..., self.index].flat[0])
+
+    @property
+    def u(self) -> float:
+        return float(self.population.u[..., self.index].flat[0])
+
+    @property
+    def spikes(self) -> list:
+        return self.population.recent(self.index)
+
+    @property
+    def spikeWindow(self) -> int:
+        return self.population.window
+
+    @spikeWindow.setter
+    def spikeWindow(self, window : int):
+        self.population.setWindow(window)
+
+    @property
+    def recorder(self) -> SpikeRecorder:
+        return self.population.recorder
+
+    @property
+    def inSyns(self) -> list:
+        # input synapses, made on demand from the projections into the layer
+        return [proj.synapse(self.index, i) for proj in self.population.inProjections for i in range(proj.pre.size)]
+
+    @property
+    def outSyns(self) -> list:
+        # output synapses, made on demand from the projections out of the layer
+        return [proj.synapse(j, self.index) for proj in self.population.outProjections for j in range(proj.post.size)]
+
+    @property
+    def recorderIndex(self) -> int:
+        return self.index
+
+    def step(self, simStep : int, dt : float, I_in : float = 0):
+        raise RuntimeError('Neuron belongs to a Population; step the Population instead')
+
+    def regSynapse(self, syn, IO : int):
+        raise RuntimeError('Neuron belongs to a Population; its synapses are the entries of a Projection')
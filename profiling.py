@@ -0,0 +1,132 @@
+"""
+    Hot path instrumentation for the vectorized network
+    StepStats(net) - per layer wall time (synaptic current vs integration), spike counts and synaptic events,
+                     plus the memory held by the state recordings; optionally logs a summary line periodically
+
+    The stats object registers itself as net.stats; Network.step only reads the clock when it is set,
+    so a network without one only pays a few `is None` tests per layer and step.
+"""
+
+import numpy as np
+
+
+class StepStats(object):
+    """
+        Counters filled in by Network.step; they add up over phases (and Network.reset) until reset()
+
+        Fields:
+        net             - the (vectorized) Network; the stats register themselves as net.stats
+        logEvery        - print a summary line every logEvery steps (0 = never)
+        log             - function called with each summary line (print by default)
+        names           - name of each layer, parallel to net.populations
+        fanOut          - number of outgoing synapses of each neuron, per layer
+        steps           - simulation steps taken (long adaptive steps count once)
+        currentTime     - wall time (in s) spent computing the synaptic currents into each layer
+        integrateTime   - wall time (in s) spent integrating each layer (including spike bookkeeping and recording)
+        spikes          - spikes of each layer (summed over the batch)
+        events          - synaptic events sent by each layer (spikes times fan out)
+        stepTime        - total wall time (in s) of the steps, including learning, decisions and adaptive steps
+    """
+    def __init__(self, net, logEvery : int = 0, log = print):
+        if not net.vectorized:
+            raise ValueError('StepStats needs the vectorized network')
+
+        self.net        = net
+        self.logEvery   = logEvery
+        self.log        = log
+
+        numHidden = len(net.populations) - 3
+        self.names = ['input', 'pain'] + ['hidden{}'.format(i + 1) for i in range(numHidden)] + ['output']
+        self.fanOut = np.array([sum(proj.post.size for proj in net.projections if proj.pre is pop)
+                                for pop in net.populations], dtype=np.int64)
+
+        self.reset()
+        net.stats = self
+
+    def reset(self):
+        """
+            Zeroes every counter
+        """
+        numLayers = len(self.net.populations)
+        self.steps          = 0
+        self.currentTime    = np.zeros(numLayers)
+        self.integrateTime  = np.zeros(numLayers)
+        self.spikes         = np.zeros(numLayers, dtype=np.int64)
+        self.events         = np.zeros(numLayers, dtype=np.int64)
+        self.stepTime       = 0.0
+
+    def layer(self, index : int, start : float, mid : float, end : float, fired : np.ndarray):
+        """
+            Books one layer update of Network.step
+            Inputs:
+                index   - layer index
+                start   - clock before the synaptic current, mid - before the integration, end - after it
+                fired   - the layer's spikes this step
+        """
+        self.currentTime[index] += mid - start
+        self.integrateTime[index] += end - mid
+        numSpikes = np.count_nonzero(fired)
+        self.spikes[index] += numSpikes
+        self.events[index] += numSpikes * self.fanOut[index]
+
+    def step(self, start : float, end : float):
+        """
+            Books one whole step of Network.step (and logs if it is time to)
+        """
+        self.steps += 1
+        self.stepTime += end - start
+
+        if self.logEvery > 0 and self.steps % self.logEvery == 0:
+            self.log(self.line())
+
+    def traceBytes(self) -> int:
+        """
+            Memory (in bytes) held by the state recordings of every layer
+        """
+        total = 0
+        for pop in self.net.populations:
+            rec = pop.stateRecorder
+            if rec is not None:
+                total += rec.steps.nbytes + sum(data.nbytes for data in rec.data.values())
+
+        return total
+
+    def summary(self) -> dict:
+        """
+            Structured copy of the counters
+            Outputs:
+                dictionary with steps, stepTime, stepsPerSec, traceBytes, and layers: one dictionary per layer with
+                name, size, currentTime, integrateTime, spikes, events and share (fraction of the step time)
+        """
+        layers = list()
+        for i, pop in enumerate(self.net.populations):
+            layerTime = self.currentTime[i] + self.integrateTime[i]
+            layers.append({'name'          : self.names[i],
+                           'size'          : pop.size,
+                           'currentTime'   : float(self.currentTime[i]),
+                           'integrateTime' : float(self.integrateTime[i]),
+                           'spikes'        : int(self.spikes[i]),
+                           'events'        : int(self.events[i]),
+                           'share'         : float(layerTime / self.stepTime) if self.stepTime > 0 else 0.0
+                           })
+
+        return {'steps'       : self.steps,
+                'stepTime'    : self.stepTime,
+                'stepsPerSec' : self.steps / self.stepTime if self.stepTime > 0 else 0.0,
+                'traceBytes'  : self.traceBytes(),
+                'layers'      : layers
+                }
+
+    def line(self) -> str:
+        """
+            One line summary: step rate, then per layer share of the time (current / integration), spikes and events
+        """
+        summary = self.summary()
+        layers = ' | '.join('{} {:.0%} ({:.2g}/{:.2g} ms) {} spk {} ev'.format(
+                                layer['name'], layer['share'], 1e3 * layer['currentTime'], 1e3 * layer['integrateTime'],
+                                layer['spikes'], layer['events'])
+                            for layer in summary['layers'])
+
+        return 'step {}: {:.4g} steps/s, trace {:.1f} KiB | {}'.format(summary['steps'], summary['stepsPerSec'],
+                                                                       summary['traceBytes'] / 1024, layers)
+
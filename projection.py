@@ -0,0 +1,139 @@
+# This file contains the projection class
+# A projection is every synapse from one Population to another, stored as a dense weight matrix
+
+import numpy as np
+from synapse import Synapse
+from population import Population
+from kernel import RecursiveKernel
+
+
+class Projection(object):
+    """
+        All-to-all synaptic connection between two layers
+
+        Fields:
+        pre         - presynaptic Population
+        post        - postsynaptic Population
+        W           - (post.size, pre.size) weight matrix with the pain sign folded in
+                      (entries are negative when pre is a pain layer)
+        sign        - -1 if pre is a pain layer, 1 otherwise
+        ispikeShape - shape of the current spike (array), or a RecursiveKernel
+    """
+    def __init__(self, pre : Population, post : Population, weights : np.ndarray, ispike : np.ndarray,
+                 W : np.ndarray = None):
+        """
+            weights is the unsigned (post.size, pre.size) weight matrix (copied); alternatively W gives the signed
+            matrix, which is kept as is (no copy, e.g. a memory map) and weights is ignored
+        """
+        self.pre         = pre
+        self.post        = post
+        self.sign        = -1 if pre.type == -1 else 1
+        if W is not None:
+            if W.shape != (post.size, pre.size):
+                raise ValueError('Weight matrix shape {} does not match the layers'.format(W.shape))
+            self.W       = W
+        else:
+            self.W       = self.sign * np.array(weights, dtype=float).reshape(post.size, pre.size)
+        self.ispikeShape = ispike
+
+        pre.outProjections.append(self)
+        post.inProjections.append(self)
+
+        if isinstance(ispike, RecursiveKernel):
+            # the presynaptic layer keeps the filter state
+            pre.addFilter(ispike)
+        else:
+            # the presynaptic layer keeps its spikes as long as they can drive this projection
+            pre.setWindow(len(ispike))
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+            Unsigned synapse weights, (post.size, pre.size)
+        """
+        return self.sign * self.W
+
+    def writableW(self) -> np.ndarray:
+        """
+            W, ready for writing in place: a read-only W (e.g. a memory map from checkpoint.load) is replaced by an
+            ordinary copy first
+        """
+        if not self.W.flags.writeable:
+            self.W = np.array(self.W)
+
+        return self.W
+
+    def current(self, act : np.ndarray) -> np.ndarray:
+        """
+            Calculates the current this projection injects into each postsynaptic neuron
+            Inputs:
+                act - presynaptic activation vector (see Population.activation)
+            Outputs:
+                weighted current, one entry per postsynaptic neuron (negative contributions from pain)
+        """
+        return self.post.backend.current(act, self.W)
+
+    def synapse(self, post : int, pre : int) -> 'SynapseView':
+        """
+            Synapse object for one entry of the weight matrix (made on demand, for introspection)
+        """
+        return SynapseView(self, post, pre)
+
+    def adjust(self, lr : float, strength : np.ndarray) -> np.ndarray:
+        """
+            Adjusts every weight of the projection at once, for training (Synapse.adjust for a whole matrix).
+            Weights saturate at the postsynaptic layer's maxI and stay non-negative, so pain projections stay
+            inhibitory.
+            Inputs:
+                lr       - learning Rate
+                strength - (post.size, pre.size) correlation values telling how strongly to increase (positive)
+                           or decrease (negative) each weight
+            Outputs:
+                The adjusted (unsigned) weights, in addition to adjusting W
+        """
+        weights = np.clip(self.weights + lr * strength, 0, self.post.maxI)
+        self.W = self.sign * weights
+
+        return weights
+
+
+class SynapseView(Synapse):
+    """
+        Synapse object backed by one entry of a Projection's weight matrix.
+        Keeps the Synapse API (pre, post, weight, ispikeShape, step, adjust) without storing a weight of its own.
+
+        Fields:
+        projection  - the Projection holding the weight
+        postIndex   - row of the weight matrix (postsynaptic neuron)
+        preIndex    - column of the weight matrix (presynaptic neuron)
+    """
+    __slots__ = ('projection', 'postIndex', 'preIndex')
+
+    def __init__(self, projection : Projection, post : int, pre : int):
+        self.projection = projection
+        self.postIndex  = post
+        self.preIndex   = pre
+        self.pre        = projection.pre.neurons()[pre]
+        self.post       = projection.post.neurons()[post]
+
+    @property
+    def weight(self) -> float:
+        return float(self.projection.sign * self.projection.W[self.postIndex, self.preIndex])
+
+    @weight.setter
+    def weight(self, weight : float):
+        self.projection.writableW()[self.postIndex, self.preIndex] = self.projection.sign * weight
+
+    @property
+    def ispikeShape(self):
+        return self.projection.ispikeShape
+
+    def setISpike(self, ispike : np.array):
+        raise RuntimeError('Synapse belongs to a Projection; the spike shape is shared by the whole Projection')
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SynapseView) and (self.projection, self.postIndex, self.preIndex) == \
+            (other.projection, other.postIndex, other.preIndex)
+
+    def __hash__(self) -> int:
+        return hash((id(self.projection), self.postIndex, self.preIndex))
@@ -0,0 +1,305 @@
+# This file contains the recorders
+# Neurons only keep the spikes that can still drive a synapse; recorders keep the full history when it is wanted
+
+import os
+import numpy as np
+
+
+class SpikeRecorder(object):
+    """
+        Full spike history of a group (layer) of neurons
+
+        Fields:
+        size    - number of neurons recorded
+        history - list (per neuron) of lists of times when a spike occurred
+    """
+    def __init__(self, size : int):
+        self.size    = size
+        self.history = [list() for _ in range(size)]
+
+    def record(self, indices, simStep : int):
+        """
+            Records a spike at simStep for each neuron index in indices (an int or an iterable of ints)
+        """
+        if isinstance(indices, int):
+            self.history[indices].append(simStep)
+        else:
+            for i in indices:
+                self.history[i].append(simStep)
+
+    def spikes(self, index : int) -> list:
+        """
+            All the spike times of neuron number index
+        """
+        return self.history[index]
+
+
+class RasterRecorder(object):
+    """
+        Spike raster of a whole network: one (neuron id, simulation step) pair per spike, appended to two columnar
+        int32 buffers in the order the spikes happen.  With a path the buffers are flushed to an append-only binary
+        file (int32 pairs) every chunkSize spikes, so memory stays bounded however long the run.
+        Queries build a CSR style index (spikes grouped by neuron) once, and again only after new spikes.
+
+        Fields:
+        size        - number of neurons, ids 0 .. size - 1 (see layer() for per layer views)
+        path        - file the spikes are streamed to (None = everything is kept in memory)
+        chunkSize   - number of spikes buffered before a flush (the initial buffer size without a path)
+        ids, steps  - int32 buffers of the spikes not flushed yet (every spike without a path)
+        count       - number of spikes in the buffers
+        flushed     - number of spikes already written to path
+        ordered     - True while the steps were recorded in nondecreasing order (lets window() bisect)
+        stepOffset  - added to every recorded step (Network.nextPhase advances it so steps keep counting across phases;
+                      appending to a file starts it after the last step already there)
+        indptr      - CSR index: the spikes of neuron i are entries indptr[i]:indptr[i + 1] of the grouped steps
+    """
+    def __init__(self, size : int, path : str = None, chunkSize : int = 65536, append : bool = False):
+        self.size       = size
+        self.path       = path
+        self.chunkSize  = chunkSize
+        self.ids        = np.empty(chunkSize, dtype=np.int32)
+        self.steps      = np.empty(chunkSize, dtype=np.int32)
+        self.count      = 0
+        self.flushed    = 0
+        self.ordered    = True
+        self.stepOffset = 0
+        self.indptr     = None
+        self._lastStep  = np.iinfo(np.int32).min
+        self._grouped   = None  # steps grouped by neuron (CSR data)
+        self._indexed   = -1    # number of spikes the index was built from
+        self._file      = None
+
+        if path is not None:
+            if append and os.path.exists(path):
+                self.flushed = os.path.getsize(path) // 8
+                ids, steps = self.columns()
+                self.ordered = bool(np.all(np.diff(steps) >= 0))
+                if len(steps) > 0:
+                    self._lastStep = int(steps[-1])
+                    # the new run starts after the last spike in the file, so the steps stay in order
+                    self.stepOffset = int(np.max(steps)) + 1
+            self._file = open(path, 'ab' if append else 'wb')
+
+    def __len__(self) -> int:
+        return self.flushed + self.count
+
+    def record(self, indices, simStep : int):
+        """
+            Records a spike at simStep for each neuron id in indices (an int or an array of ints)
+        """
+        simStep = simStep + self.stepOffset
+        n = 1 if isinstance(indices, (int, np.integer)) else len(indices)
+        if self.count + n > len(self.ids):
+            self.flush()
+            if self.count + n > len(self.ids):
+                # no file to flush to (or a huge step): make room
+                capacity = max(2 * len(self.ids), self.count + n)
+                self.ids = np.resize(self.ids, capacity)
+                self.steps = np.resize(self.steps, capacity)
+
+        self.ids[self.count:self.count + n] = indices
+        self.steps[self.count:self.count + n] = simStep
+        self.count = self.count + n
+
+        if simStep < self._lastStep:
+            self.ordered = False
+        self._lastStep = simStep
+
+    def flush(self):
+        """
+            Appends the buffered spikes to the file (nothing to do without a path)
+        """
+        if self._file is None or self.count == 0:
+            return
+
+        np.stack([self.ids[:self.count], self.steps[:self.count]], axis=1).tofile(self._file)
+        self._file.flush()
+        self.flushed = self.flushed + self.count
+        self.count = 0
+
+    def close(self):
+        """
+            Flushes and closes the file; the recorder can still be queried
+        """
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def columns(self) -> tuple:
+        """
+            Every spike recorded so far, in recording order
+            Outputs:
+                (ids, steps) - int32 arrays (memory mapped from the file when streaming)
+        """
+        if self.path is None:
+            return self.ids[:self.count], self.steps[:self.count]
+
+        self.flush()
+        if self.flushed == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+        pairs = np.memmap(self.path, dtype=np.int32, mode='r', shape=(self.flushed, 2))
+
+        return pairs[:, 0], pairs[:, 1]
+
+    def index(self):
+        """
+            Builds the CSR index (spikes grouped by neuron, in time order within a neuron) if there are new spikes
+        """
+        if self._indexed == len(self):
+            return
+
+        ids, steps = self.columns()
+        order = np.argsort(ids, kind='stable')
+        self._grouped = np.asarray(steps)[order]
+        self.indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(ids, minlength=self.size), out=self.indptr[1:])
+        self._indexed = len(self)
+
+    def neuron(self, index : int) -> np.ndarray:
+        """
+            Spike steps of neuron id index, as an int32 array
+        """
+        self.index()
+        return self._grouped[self.indptr[index]:self.indptr[index + 1]]
+
+    def spikes(self, index : int) -> list:
+        """
+            All the spike times of neuron id index (same as SpikeRecorder.spikes)
+        """
+        return self.neuron(index).tolist()
+
+    def counts(self) -> np.ndarray:
+        """
+            Number of spikes of every neuron
+        """
+        self.index()
+        return np.diff(self.indptr)
+
+    def window(self, start : int, stop : int) -> tuple:
+        """
+            Every spike with start <= step < stop
+            Outputs:
+                (ids, steps) - int32 arrays, in recording order
+        """
+        ids, steps = self.columns()
+        if self.ordered:
+            lo, hi = np.searchsorted(steps, [start, stop])
+            return np.asarray(ids[lo:hi]), np.asarray(steps[lo:hi])
+
+        inside = (steps >= start) & (steps < stop)
+        return np.asarray(ids[inside]), np.asarray(steps[inside])
+
+    def layer(self, offset : int, size : int) -> 'RasterView':
+        """
+            View of the neurons offset .. offset + size - 1 that records and answers with layer indices
+        """
+        return RasterView(self, offset, size)
+
+
+class RasterView(object):
+    """
+        One layer of a RasterRecorder, usable wherever a SpikeRecorder is (Population.record, Neuron.record)
+
+        Fields:
+        raster  - the network wide RasterRecorder
+        offset  - id of the layer's first neuron in the raster
+        size    - number of neurons in the layer
+    """
+    def __init__(self, raster : RasterRecorder, offset : int, size : int):
+        self.raster = raster
+        self.offset = offset
+        self.size   = size
+
+    def record(self, indices, simStep : int):
+        """
+            Records a spike at simStep for each layer index in indices (an int or an array of ints)
+        """
+        if isinstance(indices, (int, np.integer)):
+            self.raster.record(self.offset + indices, simStep)
+        else:
+            self.raster.record(self.offset + np.asarray(indices), simStep)
+
+    def neuron(self, index : int) -> np.ndarray:
+        return self.raster.neuron(self.offset + index)
+
+    def spikes(self, index : int) -> list:
+        return self.raster.spikes(self.offset + index)
+
+
+class StateRecorder(object):
+    """
+        Preallocated recording of the state variables of a group (layer) of neurons
+
+        Fields:
+        numSteps    - number of simulation steps preallocated for
+        variables   - names of the recorded variables, any of 'v', 'u', 'I'
+        indices     - indices of the recorded neurons (None = every neuron)
+        every       - decimation factor: one sample every `every` simulation steps
+        data        - {variable : array of samples}, first axis is the sample, last axis the recorded neuron
+        steps       - simulation step of each sample
+        count       - number of samples written so far
+    """
+    def __init__(self, numSteps : int, variables : tuple = ('v',), indices : list = None, every : int = 1):
+        for var in variables:
+            if var not in ('v', 'u', 'I'):
+                raise ValueError('Illegal variable {}: must be \'v\', \'u\' or \'I\''.format(var))
+        if every < 1:
+            raise ValueError('Illegal decimation factor: must be at least 1')
+
+        self.numSteps   = numSteps
+        self.variables  = tuple(variables)
+        self.indices    = None if indices is None else np.asarray(indices, dtype=int)
+        self.every      = every
+        self.capacity   = numSteps // every + 1
+        self.data       = dict()
+        self.steps      = np.empty(self.capacity, dtype=np.int64)
+        self.count      = 0
+
+    def sample(self, simStep : int, **values):
+        """
+            Records the given variables (as keyword arrays, e.g. v=..., u=...) if simStep is on the decimation grid
+        """
+        if simStep % self.every != 0:
+            return
+
+        if self.count == self.capacity:
+            # ran past the preallocated length, make room
+            self.capacity = 2 * self.capacity
+            self.steps = np.resize(self.steps, self.capacity)
+            for var in self.data:
+                self.data[var] = np.resize(self.data[var], (self.capacity,) + self.data[var].shape[1:])
+
+        for var in self.variables:
+            value = np.asarray(values[var], dtype=float)
+            if self.indices is not None:
+                value = value[..., self.indices]
+            if var not in self.data:
+                self.data[var] = np.empty((self.capacity,) + value.shape)
+            self.data[var][self.count] = value
+
+        self.steps[self.count] = simStep
+        self.count = self.count + 1
+
+    def clear(self):
+        """
+            Forgets the samples, keeping the buffers for the next recording
+        """
+        self.count = 0
+
+    def trace(self, var : str, index : int = None) -> np.ndarray:
+        """
+            Recorded samples of variable var, for one neuron (index into the layer) or for all recorded neurons
+        """
+        if var not in self.variables:
+            raise KeyError('{} is not being recorded'.format(var))
+
+        samples = self.data[var][:self.count]
+        if index is None:
+            return samples
+        if self.indices is not None:
+            if index not in self.indices:
+                raise KeyError('neuron {} is not being recorded'.format(index))
+            index = int(np.flatnonzero(self.indices == index)[0])
+
+        return samples[..., index]
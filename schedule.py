@@ -0,0 +1,176 @@
+"""
+    Phase scheduling for the vectorized network
+    Phase(name)             - one phase of a sample: which currents drive the network, and for how long
+    PhaseScheduler(net)     - runs batches of samples through a sequence of phases (by default propagate, pain, rest)
+    painOnError()           - pain current of the pain phase: injected into the samples whose output was wrong
+
+    Samples run back to back on the same network: Network.reset puts the state back in place between batches and
+    Network.nextPhase carries it from one phase to the next, so once the first batch has run nothing is rebuilt or
+    reallocated (unless the batch size changes) and a sample only costs its simulation steps.
+"""
+
+import numpy as np
+from synapse import maxI
+
+
+class Phase(object):
+    """
+        One phase of the schedule
+
+        Fields:
+        name        - key of the phase in the results (unique within a schedule)
+        input       - True to drive the input neurons with the sample's currents, False to leave them without input
+        pain        - external current of the pain neurons: a float, a (batch, pain neurons) array, or a function
+                      pain(net, labels, results) of the labels and the results of the phases already run
+                      (see painOnError)
+        duration    - length of the phase in ms (None = the network's phaseDuration, which is also the longest)
+    """
+    def __init__(self, name : str, input : bool = True, pain = 0, duration : float = None):
+        self.name       = name
+        self.input      = input
+        self.pain       = pain
+        self.duration   = duration
+
+    def painCurrent(self, net, labels, results : dict):
+        """
+            Pain current of the phase for the current batch
+        """
+        if callable(self.pain):
+            return self.pain(net, labels, results)
+
+        return self.pain
+
+
+def _winner(result : dict) -> np.ndarray:
+    """
+        Winning output of each sample of a phase result (decision winner, or most spikes; -1 = no output spike)
+    """
+    if 'winner' in result:
+        return result['winner']
+
+    counts = result['counts']
+    return np.where(counts.max(axis=-1) > 0, np.argmax(counts, axis=-1), -1)
+
+
+def painOnError(level : float = maxI, phase : str = 'propagate'):
+    """
+        Pain current function for Phase: level into every pain neuron of the samples whose winning output in the
+        phase named phase is not their label (no pain without labels)
+    """
+    def pain(net, labels, results):
+        if labels is None:
+            return 0
+
+        wrong = _winner(results[phase]) != np.asarray(labels)
+        return np.where(wrong, float(level), 0.0)[:, None]
+
+    return pain
+
+
+class PhaseScheduler(object):
+    """
+        Runs samples through a sequence of phases on one (vectorized) Network.  Each batch starts from the reset
+        state; every following phase continues from the state the previous one ended in (see Network.nextPhase).
+        Learning and decision rules registered on the network apply in every phase.  State recordings restart their
+        steps at every phase, the raster keeps counting steps through the whole schedule.
+
+        Fields:
+        net         - the (vectorized) Network
+        phases      - list of Phase, run in order for every batch
+        steps       - total simulation steps taken by the schedule so far
+    """
+    def __init__(self, net, phases : list = None):
+        if not net.vectorized:
+            raise ValueError('Phase scheduling needs the vectorized network')
+        if phases is None:
+            phases = [Phase('propagate'), Phase('pain', pain=painOnError()), Phase('rest', input=False)]
+
+        names = [phase.name for phase in phases]
+        if len(set(names)) != len(names):
+            raise ValueError('Phase names must be unique')
+        for phase in phases:
+            if phase.duration is not None and phase.duration > net.phaseDuration:
+                raise ValueError('Phase {} is longer than the network phaseDuration'.format(phase.name))
+
+        self.net        = net
+        self.phases     = phases
+        self.steps      = 0
+
+    def _runBatch(self, I_in : np.ndarray, labels) -> dict:
+        """
+            Runs one batch through every phase
+            Outputs:
+                {phase name : result}, see run
+        """
+        net = self.net
+        if net.raster is not None:
+            # keep the raster on one time line across batches
+            net.raster.stepOffset = net.raster.stepOffset + net.simStep
+        net.reset(batch=I_in.shape[0])
+
+        noInput = np.zeros(I_in.shape)
+        results = dict()
+        for k, phase in enumerate(self.phases):
+            if k > 0:
+                net.nextPhase()
+
+            I_pain = phase.painCurrent(net, labels, results)
+            I = I_in if phase.input else noInput
+            if phase.duration is None:
+                net.step(I_in=I, I_pain=I_pain)
+            else:
+                net.step(I_in=I, I_pain=I_pain, steps=int(phase.duration / net.dt))
+                decided = net.decision is not None and bool(np.all(net.decision.decisionStep >= 0))
+                if net.simStep < len(net.t) and not decided:
+                    # shorter than the network's phase, which step left open
+                    net.endPhase()
+            self.steps = self.steps + net.simStep
+
+            out = net.populations[-1]
+            result = {'counts'     : out.spikeCount.copy(),
+                      'firstSpike' : out.firstSpike.copy(),
+                      'steps'      : np.full(I_in.shape[0], net.simStep)
+                      }
+            if net.decision is not None:
+                decisionStep = net.decision.decisionStep
+                result['winner'] = net.decision.winner.copy()
+                result['decisionStep'] = decisionStep.copy()
+                # a sample needs the steps up to its own decision, even if the batch ran on for others
+                result['steps'] = np.where(decisionStep >= 0, decisionStep + 1, net.simStep)
+            results[phase.name] = result
+
+        return results
+
+    def run(self, I_in : np.ndarray, labels : np.ndarray = None, batchSize : int = None) -> dict:
+        """
+            Runs samples through the schedule
+            Inputs:
+                I_in      - input currents, (N, inputs) array (one row per sample) or a single sample
+                labels    - (N,) expected output of each sample, for pain functions such as painOnError (None = unknown)
+                batchSize - samples simulated at once (None = all of them); batches of equal size reuse the state arrays
+            Outputs:
+                {phase name : dictionary with, for every sample,
+                    counts       - (N, outputs) output spikes in the phase
+                    firstSpike   - (N, outputs) time index (from the start of the phase) of the first output spike
+                                   in the phase (-1 = no spike)
+                    steps        - (N,) steps the sample needed in the phase: up to and including its decision step
+                                   with a decision rule (the batch runs on until every sample is decided), the
+                                   steps simulated otherwise
+                    and, with a decision rule, winner and decisionStep (see decision.DecisionRule)}
+        """
+        I_in = np.asarray(I_in, dtype=float)
+        if I_in.ndim == 1:
+            I_in = I_in[None, :]
+        if labels is not None:
+            labels = np.asarray(labels).reshape(-1)
+        if batchSize is None:
+            batchSize = len(I_in)
+
+        chunks = list()
+        for start in range(0, len(I_in), batchSize):
+            chunks.append(self._runBatch(I_in[start:start + batchSize],
+                                         None if labels is None else labels[start:start + batchSize]))
+
+        return {phase.name : {key : np.concatenate([chunk[phase.name][key] for chunk in chunks])
+                              for key in chunks[0][phase.name]}
+                for phase in self.phases}
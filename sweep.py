@@ -0,0 +1,305 @@
+"""
+    Parameter sweeps over the network configuration
+    grid(space)            - every combination of the listed values
+    randomSearch(space, n) - n configurations drawn at random from ranges / lists of values
+    sweep(configs, ...)    - evaluates every configuration on a process pool, caching each result on disk
+    writeTable(rows, path) - writes the results table as CSV
+
+    A configuration is a flat dictionary of the keys in `defaults`: the network structure, phaseDuration and dt,
+    the spike shape (rt, ft, holdTime in whole ms, see funcs.ispike), the Izhikevich parameters a, b, c, d
+    (every neuron), maxI, and the seed the weights are drawn with.  Each result is stored in cacheDir under a hash of the full
+    configuration and of the images evaluated, so repeating or extending a sweep only computes the new points.
+
+    python sweep.py [data/test [results.csv]] - sweeps the spike shape and maxI on a dataGen set
+"""
+
+import csv
+import hashlib
+import itertools
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import numpy as np
+from synapse import maxI
+from neuron import Neuron
+from network import Network
+from evaluate import evaluate
+from dataGen import loadSplit
+
+# Every configuration key, with its default value
+defaults = {'structure'     : [4, 1, 3, 10],
+            'phaseDuration' : 100,
+            'dt'            : 0.1,
+            'rt'            : 2,
+            'ft'            : 35,
+            'holdTime'      : 0,
+            'a'             : Neuron.params['a'],
+            'b'             : Neuron.params['b'],
+            'c'             : Neuron.params['c'],
+            'd'             : Neuron.params['d'],
+            'maxI'          : maxI,
+            'seed'          : 41
+            }
+
+# Result columns of the table, after the configuration
+metrics = ['accuracy', 'meanSpikes', 'silent', 'firstTime', 'seconds']
+
+
+""" Search spaces """
+def _config(values : dict) -> dict:
+    """
+        Full configuration: defaults overridden by values
+    """
+    unknown = set(values) - set(defaults)
+    if len(unknown) > 0:
+        raise KeyError('Unknown sweep parameters: {}'.format(', '.join(sorted(unknown))))
+
+    config = dict(defaults)
+    config.update(values)
+    return config
+
+
+def grid(space : dict) -> list:
+    """
+        Every combination of the values in space
+        Inputs:
+            space - {parameter : list of values}; a value that is not a list is kept fixed (structures are lists,
+                    so a structure to sweep is given as a list of lists)
+        Outputs:
+            list of configurations, the last parameter varying fastest
+    """
+    names = list(space)
+    axes = list()
+    for name in names:
+        values = space[name]
+        if not isinstance(values, (list, tuple)) or (name == 'structure' and not isinstance(values[0], (list, tuple))):
+            values = [values]
+        axes.append(values)
+
+    return [_config(dict(zip(names, point))) for point in itertools.product(*axes)]
+
+
+def randomSearch(space : dict, n : int, seed : int = 0) -> list:
+    """
+        n configurations drawn at random from space
+        Inputs:
+            space - {parameter : (low, high) tuple to draw uniformly from (an integer if both ends are integers),
+                     or a list of values to choose from, or a fixed value}
+            seed  - seed of the draws (the same seed gives the same configurations)
+    """
+    rng = random.Random(seed)
+    configs = list()
+    for _ in range(n):
+        values = dict()
+        for name, choices in space.items():
+            if isinstance(choices, tuple):
+                low, high = choices
+                if isinstance(low, int) and isinstance(high, int):
+                    values[name] = rng.randint(low, high)
+                else:
+                    values[name] = rng.uniform(low, high)
+            elif isinstance(choices, list) and not (name == 'structure' and not isinstance(choices[0], (list, tuple))):
+                values[name] = rng.choice(choices)
+            else:
+                values[name] = choices
+        configs.append(_config(values))
+
+    return configs
+
+
+""" Caching """
+def dataDigest(images : np.ndarray, labels : np.ndarray) -> str:
+    """
+        Hash of an evaluation set, part of every cache key
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(images, dtype=np.float32).tobytes())
+    digest.update(np.ascontiguousarray(labels, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def configKey(config : dict, data : str) -> str:
+    """
+        Cache key of a configuration evaluated on the set with digest data
+    """
+    text = json.dumps({'config' : config, 'data' : data}, sort_keys=True)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _cachePath(cacheDir : str, key : str) -> str:
+    return os.path.join(cacheDir, key + '.json')
+
+
+def _readCache(cacheDir : str, key : str) -> dict:
+    """
+        Cached result of key (None if it was not computed yet)
+    """
+    if cacheDir is None or not os.path.exists(_cachePath(cacheDir, key)):
+        return None
+
+    with open(_cachePath(cacheDir, key), 'r') as f:
+        return json.load(f)['result']
+
+
+def _writeCache(cacheDir : str, key : str, config : dict, result : dict):
+    """
+        Stores a result (written to a temporary file first, so an interrupted sweep never leaves a partial entry)
+    """
+    if cacheDir is None:
+        return
+
+    path = _cachePath(cacheDir, key)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'config' : config, 'result' : result}, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+""" Evaluation """
+def build(config : dict) -> Network:
+    """
+        The vectorized network of a configuration, with its weights drawn from the configuration's seed
+    """
+    random.seed(config['seed'])
+    net = Network(phaseDuration=config['phaseDuration'], dt=config['dt'], structure=config['structure'],
+                  spikeShape={'rt' : config['rt'], 'ft' : config['ft'], 'holdTime' : config['holdTime']},
+                  maxI=config['maxI'], params={key : config[key] for key in 'abcd'}, recordState=())
+
+    return net
+
+
+def evaluateConfig(config : dict, images : np.ndarray, labels : np.ndarray, batchSize : int = 64) -> dict:
+    """
+        Scores one configuration on a set of images
+        Outputs:
+            dictionary with
+                accuracy    - fraction of the images predicted correctly
+                meanSpikes  - output spikes per image
+                silent      - fraction of the images without any output spike
+                firstTime   - mean time (in ms) of the first output spike of the images with one (nan = none)
+                seconds     - wall time of the evaluation
+    """
+    start = time.perf_counter()
+    net = build(config)
+    out = evaluate(net, images=images, labels=labels, processes=1, chunkSize=len(images), batchSize=batchSize)
+
+    counts = out['counts'].sum(axis=1)
+    first = np.where(out['firstSpike'] >= 0, out['firstSpike'], np.iinfo(np.int64).max).min(axis=1)
+    spiked = counts > 0
+
+    return {'accuracy'   : out['accuracy'],
+            'meanSpikes' : float(np.mean(counts)),
+            'silent'     : float(np.mean(~spiked)),
+            'firstTime'  : float(np.mean(first[spiked]) * config['dt']) if spiked.any() else float('nan'),
+            'seconds'    : time.perf_counter() - start
+            }
+
+
+_data = dict()  # per process evaluation set
+
+
+def _initWorker(images : np.ndarray, labels : np.ndarray, batchSize : int):
+    _data['images'] = images
+    _data['labels'] = labels
+    _data['batchSize'] = batchSize
+
+
+def _runPoint(task : tuple) -> tuple:
+    """
+        Evaluates one configuration in a worker and caches the result
+        Outputs:
+            (key, result)
+    """
+    config, key, cacheDir = task
+    result = evaluateConfig(config, _data['images'], _data['labels'], _data['batchSize'])
+    _writeCache(cacheDir, key, config, result)
+
+    return key, result
+
+
+def sweep(configs : list, path : str = None, images : np.ndarray = None, labels : np.ndarray = None,
+          processes : int = None, cacheDir : str = './sweeps', batchSize : int = 64, log = None) -> list:
+    """
+        Evaluates every configuration, one per worker process at a time, skipping the ones found in the cache
+        Inputs:
+            configs   - list of configurations (see grid and randomSearch; missing keys take the defaults)
+            path      - dataGen set to evaluate on (see dataGen.loadSplit); or give images and labels
+            processes - number of worker processes (None = one per core, 1 = run in this process)
+            cacheDir  - directory of the cached results (created if needed; None = no caching)
+            batchSize - number of images simulated at once (see Network.run)
+            log       - function called with a progress line after every computed configuration (None = quiet)
+        Outputs:
+            results table: one row (dictionary) per configuration, in the order of configs, with the configuration
+            keys, the metrics (see evaluateConfig), key (the cache key) and cached (True if it was not recomputed)
+    """
+    if path is not None:
+        images, labels = loadSplit(path)
+    images = np.asarray(images)
+    labels = np.asarray(labels)
+    if cacheDir is not None:
+        os.makedirs(cacheDir, exist_ok=True)
+
+    configs = [_config(config) for config in configs]
+    data = dataDigest(images, labels)
+    keys = [configKey(config, data) for config in configs]
+
+    results = dict()    # {key : result}; a configuration listed twice is computed once
+    tasks = list()
+    for config, key in zip(configs, keys):
+        if key in results or any(task[1] == key for task in tasks):
+            continue
+        cached = _readCache(cacheDir, key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            tasks.append((config, key, cacheDir))
+    cached = set(results)
+
+    def done(count : int):
+        if log is not None:
+            log('{}/{} configurations computed ({} cached)'.format(count, len(tasks), len(cached)))
+
+    if processes == 1 or len(tasks) <= 1:
+        _initWorker(images, labels, batchSize)
+        for count, task in enumerate(tasks):
+            key, results[key] = _runPoint(task)
+            done(count + 1)
+        _data.clear()
+    else:
+        with mp.Pool(processes=processes, initializer=_initWorker, initargs=(images, labels, batchSize)) as pool:
+            for count, (key, result) in enumerate(pool.imap_unordered(_runPoint, tasks)):
+                results[key] = result
+                done(count + 1)
+
+    rows = list()
+    for config, key in zip(configs, keys):
+        row = dict(config)
+        row.update(results[key])
+        row['key'] = key
+        row['cached'] = key in cached
+        rows.append(row)
+
+    return rows
+
+
+def writeTable(rows : list, path : str):
+    """
+        Writes a results table (see sweep) as CSV, one column per configuration key and metric
+    """
+    columns = list(defaults) + metrics + ['key', 'cached']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict(row, structure='-'.join(str(n) for n in row['structure'])))
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else './data/test'
+    rows = sweep(grid({'rt' : [1, 2, 4], 'ft' : [15, 35], 'maxI' : [60, 80]}), path=path, log=print)
+    for row in sorted(rows, key=lambda row: -row['accuracy']):
+        print('rt {rt} ft {ft} maxI {maxI}: accuracy {accuracy:.3f}, {meanSpikes:.2f} spikes/image'.format(**row))
+    if len(sys.argv) > 2:
+        writeTable(rows, sys.argv[2])
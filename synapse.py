@@ -3,30 +3,67 @@
 maxI = 80   # maximum synapse current.  This gives a refractory period of ~4 ms
 
 
-from neuron import Neuron
+from neuron import Neuron, synapticCurrent
 import numpy as np
 
 
 
 class Synapse(object):
+    # a Synapse is a handle on one entry of its postsynaptic neuron's input arrays (Neuron.inWeights, inShapeIdx), so
+    # the connection itself costs no object; Neuron.inSyns / outSyns make handles on demand
+    # fixed attributes (no per instance __dict__)
+    __slots__ = ('pre', 'post', 'index')
     
     def __init__(self, preNeuron : Neuron, postNeuron : Neuron, weight : float, ispike : np.array = None):
         self.pre = preNeuron        # Presynaptic Neuron
         self.post = postNeuron      # Postsynaptic Neuron
-        self.weight = weight        # Synapse Weight
-        if ispike is not None:
-            self.ispikeShape = ispike   # Shape of Current Spike
+        self.index = None           # entry in the postsynaptic neuron's input arrays (None = not registered yet)
 
         # register with the neurons
+        self.post.regSynapse(self,1)
+        self.weight = weight        # Synapse Weight
+        self.ispikeShape = ispike   # Shape of Current Spike (None = not set yet, see setISpike)
         self.pre.regSynapse(self,0)
-        self.post.regSynapse(self,1)    
-        
+
+    @classmethod
+    def at(cls, post : Neuron, index : int):
+        """
+            Handle on input synapse number index of neuron post (nothing is registered)
+        """
+        syn = cls.__new__(cls)
+        syn.pre = post.inPre[index]
+        syn.post = post
+        syn.index = index
+        return syn
+
+    @property
+    def weight(self) -> float:
+        return self.post.inWeights[self.index]
+
+    @weight.setter
+    def weight(self, weight : float):
+        self.post.inWeights[self.index] = weight
+
+    @property
+    def ispikeShape(self):
+        return self.post.inShapes[self.post.inShapeIdx[self.index]]
+
+    @ispikeShape.setter
+    def ispikeShape(self, ispike : np.array):
+        self.post.inShapeIdx[self.index] = self.post.shapeIndex(ispike)
+
+    def __eq__(self, other) -> bool:
+        return type(other) is Synapse and self.post is other.post and self.index == other.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.post), self.index))
     
     def setISpike(self, ispike : np.array):
         """
             Sets Current Spike shape of this synapse
         """
         self.ispikeShape = ispike
+        self.pre.spikeWindow = max(self.pre.spikeWindow, len(ispike))
         
     
 
@@ -38,21 +75,7 @@ class Synapse(object):
             Outputs:
                 weighted current from this synapse (including negative if pain)
         """
-        synI = 0
-        if len(self.pre.spikes) != 0:
-            # retrieve spikes from the preneuron
-            for spike in self.pre.spikes:
-                if simStep - spike < len(self.ispikeShape):
-                    # Possible overlapping spikes
-                    # Find whichever current value in spike is strongest
-                    if spike <= simStep and self.ispikeShape[int(simStep-spike)] > synI:
-                        synI = self.ispikeShape[int(simStep-spike)]
-
-        # see if the previous neuron is a pain neuron. If it is, current counts as a negative
-        if self.pre.type == -1:
-            synI = -1 * synI
-
-        return synI * self.weight
+        return synapticCurrent(self.pre, self.ispikeShape, simStep) * self.weight
 
    
 
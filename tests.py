@@ -1,10 +1,24 @@
 from synapse import Synapse
 from neuron import Neuron
+from network import Network
+import backend
+import decision
+import checkpoint
+import adaptive
+from adaptive import AdaptiveStepper
+import schedule
+import sweep
 import funcs
 import numpy as np
 import matplotlib.pyplot as plt
 import random
 import math
+import tempfile
+import os
+from recorder import RasterRecorder
+import kernel
+from kernel import RecursiveKernel
+from learning import STDP
 
 _INPUT = 1
 _OUTPUT = 0
@@ -299,6 +313,384 @@ def painIntoPain():
     plt.grid()
     plt.show()
 
+""" NETWORK TESTS """
+def stdpMatch():
+    """
+        Make sure STDP potentiates pre before post, depresses post before pre, and that strong pain mirrors (but never
+        amplifies) both updates
+    """
+    def change(order : str, painSteps : int) -> float:
+        random.seed(41)
+        net = Network(phaseDuration=10, dt=0.1, structure=[1, 1, 1], recordState=())
+        stdp = STDP(net, lr=1.0)
+        proj = [proj for proj in net.projections
+                if proj.pre is net.populations[0] and proj.post is net.populations[-1]][0]
+        before = proj.weights.copy()
+        on, off = np.array([True]), np.array([False])
+        for _ in range(painSteps):
+            stdp.step([off, on, off])
+        first, second = (0, 2) if order == 'pre-post' else (2, 0)
+        stdp.step([on if i == first else off for i in range(3)])
+        stdp.step([on if i == second else off for i in range(3)])
+        return (proj.weights - before).item()
+
+    plain = [change('pre-post', 0), change('post-pre', 0)]
+    pain = [change('pre-post', 40), change('post-pre', 40)]
+
+    if plain[0] > 0 and plain[1] < 0 and pain[0] < 0 and pain[1] > 0 and \
+            all(abs(p) <= abs(q) + 1e-12 for p, q in zip(pain, plain)):
+        print(f"PASSED: STDP potentiates pre->post, depresses post->pre, and pain mirrors the updates")
+    else:
+        print(f"FAILED: STDP update signs or pain modulation are wrong ({plain}, {pain})")
+
+def synapseArrays():
+    """
+        Make sure Synapse objects made on demand share the connection kept in the neuron arrays, and that registering
+        a synapse again does not duplicate it
+    """
+    shape = funcs.ispikeKernel(dt=0.1)
+    pre, post = Neuron(type=_INPUT, recordV=False), Neuron(type=_OUTPUT, recordV=False)
+    syn = Synapse(preNeuron=pre, postNeuron=post, weight=20.0, ispike=shape)
+    pre.regSynapse(syn, 0)
+    post.regSynapse(post.inSyns[0], 1)
+    pre.outSyns[0].adjust(lr=1.0, strength=5.0)
+    pre.spikes = [0]
+
+    if len(pre.outSyns) == 1 and len(post.inSyns) == 1 and pre.outSyns[0] == syn and syn.weight == 25.0 and \
+            post._calcI(simStep=10) == syn.step(simStep=10) == shape[10] * 25.0:
+        print(f"PASSED: Synapses made on demand share one registered connection")
+    else:
+        print(f"FAILED: Synapses made on demand differ or were registered twice")
+
+def kernelMatch():
+    """
+        Make sure the recursive kernel follows the ispike table (peak 1, close to it everywhere) and rejects spike
+        shapes it cannot model (rise time not shorter than fall time); on a spike train it only matches the table
+        while the spikes do not overlap (it adds them up, the table takes the strongest)
+    """
+    table = funcs.ispikeKernel(dt=0.1)
+    recursive = RecursiveKernel(dt=0.1).impulse(len(table))
+    close = abs(np.max(recursive) - 1) < 1e-12 and np.max(np.abs(recursive - table)) < 0.1 and \
+        abs(np.argmax(recursive) - np.argmax(table)) * 0.1 <= 1
+    sparse = kernel.ispikeDeviation(dt=0.1, interval=50)
+    dense = kernel.ispikeDeviation(dt=0.1, interval=4)
+    trains = sparse['trainDeviation'] == sparse['maxDeviation'] and dense['trainPeak'] > 1.5
+
+    rejected = 0
+    for rt, ft in [(5, 5), (3, 2)]:
+        try:
+            RecursiveKernel(dt=0.1, rt=rt, ft=ft)
+        except ValueError:
+            rejected += 1
+
+    if close and trains and rejected == 2:
+        print(f"PASSED: Recursive kernel follows the ispike table, adds up overlapping spikes (peak "
+              f"{dense['trainPeak']:.2f} every 4 ms) and rejects rt >= ft")
+    else:
+        print(f"FAILED: Recursive kernel differs from the ispike table, on a spike train, or accepts rt >= ft")
+
+def popMatch():
+    """
+        Make sure the vectorized (Population) network gives the same spike times as the Neuron-by-Neuron network
+    """
+    spikes = list()
+    for vectorized in [True, False]:
+        random.seed(41)
+        net = Network(phaseDuration=50, dt=0.1, structure=[2, 1, 2, 3], vectorized=vectorized, recordSpikes=True)
+        net.step(I_in=[30, 20], I_pain=10)
+        spikes.append([[neu.spikeHistory for neu in layer] for layer in net.neurons])
+
+    if spikes[0] == spikes[1]:
+        print(f"PASSED: Population spike times match Neuron spike times")
+    else:
+        print(f"FAILED: Population spike times differ from Neuron spike times")
+
+def batchMatch():
+    """
+        Make sure a batch of samples gives the same output spike counts as running the samples one at a time, also
+        with the spike raster recording them (one sample per run, larger batches rejected)
+    """
+    random.seed(41)
+    net = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=())
+    I_in = np.array([[80, 0, 0, 80], [0, 80, 80, 0], [80, 80, 0, 0]])
+
+    batched = net.run(I_in)['counts']
+    single = np.array([net.run(I)['counts'][0] for I in I_in])
+
+    random.seed(41)
+    net = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=(), recordSpikes=True)
+    recorded = np.array([net.run(I)['counts'][0] for I in I_in])
+    rastered = net.raster.counts()[-3:]
+    try:
+        net.run(I_in)
+        rejected = False
+    except ValueError:
+        rejected = True
+
+    if np.array_equal(batched, single) and np.array_equal(batched, recorded) \
+            and np.array_equal(rastered, batched.sum(axis=0)) and rejected:
+        print(f"PASSED: Batched output spike counts match single samples")
+    else:
+        print(f"FAILED: Batched output spike counts differ from single samples")
+
+def backendMatch():
+    """
+        Make sure every available backend gives the same spike times as the reference backend
+    """
+    for name, match in backend.crossCheck().items():
+        if match:
+            print(f"PASSED: {name} backend spike times match the reference")
+        else:
+            print(f"FAILED: {name} backend spike times differ from the reference")
+
+def gatedMatch():
+    """
+        Make sure activity gating gives the same spike times as stepping every neuron, and membrane potentials within
+        the settling tolerance
+    """
+    results = list()
+    for gated in [False, True]:
+        random.seed(41)
+        net = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordSpikes=True, gated=gated)
+        net.step(I_in=[30, 0, 0, 40], I_pain=0)
+        results.append(([[neu.spikeHistory for neu in layer] for layer in net.neurons],
+                         [pop.stateRecorder.trace('v').tolist() for pop in net.populations]))
+
+    if results[0][0] == results[1][0] and all(np.allclose(a, b, rtol=0, atol=1e-3) for a, b in zip(results[0][1],
+                                                                                         results[1][1])):
+        print(f"PASSED: Gated spike times and membrane potentials match ungated ones")
+    else:
+        print(f"FAILED: Gated spike times or membrane potentials differ from ungated ones")
+
+def gatedUpdates():
+    """
+        Make sure gating integrates fewer neurons per step as the activity drops, and none once every neuron is at rest
+    """
+    random.seed(41)
+    net = Network(phaseDuration=100, dt=0.1, structure=[4, 1, 3, 20, 20], recordState=(), gated=True)
+    updates = list()
+    for k, I_in in enumerate([[80, 0, 0, 80], [30, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]):
+        if k > 0:
+            net.nextPhase()
+        before = sum(pop.updates for pop in net.populations)
+        net.step(I_in=I_in, I_pain=0)
+        updates.append(sum(pop.updates for pop in net.populations) - before)
+
+    if all(a > b for a, b in zip(updates, updates[1:-1])) and updates[-1] == 0:
+        print(f"PASSED: Gated updates fall with the activity: {updates}")
+    else:
+        print(f"FAILED: Gated updates do not fall with the activity: {updates}")
+
+def gatedRestBound():
+    """
+        Make sure the resting trajectory of a gated layer stays bounded across phases when it never closes (LTS rests
+        on a spiral), and the neurons integrated past its end still match the ungated network
+    """
+    results = list()
+    lengths = list()
+    for gated in [False, True]:
+        random.seed(41)
+        net = Network(phaseDuration=100, dt=0.1, structure=[4, 1, 3, 5], recordState=(), recordSpikes=True,
+                      gated=gated, params='LTS')
+        for pop in net.populations:
+            pop.restLimit = 300
+        for k in range(5):
+            if k > 0:
+                net.nextPhase()
+            net.step(I_in=[30, 0, 0, 0] if k < 2 else [0, 0, 0, 0], I_pain=0)
+            lengths.append(max(len(pop.restV) for pop in net.populations))
+        results.append(([[neu.spikeHistory for neu in layer] for layer in net.neurons],
+                        [pop.v.copy() for pop in net.populations]))
+
+    if max(lengths) <= 300 + 2 and results[0][0] == results[1][0] \
+            and all(np.allclose(a, b, rtol=0, atol=1e-3) for a, b in zip(results[0][1], results[1][1])):
+        print(f"PASSED: Gated resting trajectory stays within {max(lengths)} steps across phases")
+    else:
+        print(f"FAILED: Gated resting trajectory grows to {max(lengths)} steps, or the network differs from ungated")
+
+def adaptiveMatch():
+    """
+        Make sure adaptive steps keep the spike times within tolT, save integrations at rest and cost little more than
+        fixed dt steps while the network keeps spiking
+    """
+    rest = adaptive.timingError(I_in=[0, 0, 0, 0], tolT=0.05)
+    driven = adaptive.timingError(I_in=[20, 30, 40, 50], tolT=0.05)
+
+    if all(result['maxError'] <= 0.05 for result in [rest, driven]) \
+            and rest['integrations'] < rest['baseIntegrations'] / 2 \
+            and driven['integrations'] < 1.05 * driven['baseIntegrations']:
+        print(f"PASSED: Adaptive steps take {rest['integrations']} integrations instead of "
+              f"{rest['baseIntegrations']} at rest, {driven['integrations']} instead of "
+              f"{driven['baseIntegrations']} while spiking")
+    else:
+        print(f"FAILED: Adaptive steps miss the spike times or cost too much: {rest}, {driven}")
+
+def adaptiveRecording():
+    """
+        Make sure long adaptive steps keep one state sample per step and let the decision rule settle at the step it
+        would with fixed dt (relative to the first output spike)
+    """
+    results = list()
+    for adaptive in [False, True]:
+        net = Network(phaseDuration=50, dt=0.01, structure=[1, 1, 2], recordState=('v',), adaptive=adaptive,
+                      weights=[np.zeros((1, 1)), np.array([[80.0], [0.0]]), np.zeros((2, 1))])
+        if adaptive:
+            net.adaptive = AdaptiveStepper(net, tolT=0.5)
+        decision.TimeToFirstSpike(net, gap=10)
+        out = net.run(np.array([[4]]))
+        recorder = net.populations[-1].stateRecorder
+        results.append((int(net.decision.decisionStep[0] - out['firstSpike'][0, 0]),
+                        np.array_equal(recorder.steps[:recorder.count], np.arange(net.simStep + 1))))
+
+    if results[0] == results[1] and results[1][1] and net.adaptive.stats['longSteps'] > 0:
+        print(f"PASSED: Adaptive steps keep every state sample and decide {results[1][0]} steps after the first spike")
+    else:
+        print(f"FAILED: Adaptive steps lose state samples or decide late: {results}")
+
+def decisionMatch():
+    """
+        Make sure the first spike decision stops the phase early and picks the output that spikes first in a full phase
+    """
+    random.seed(41)
+    net = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=())
+    I_in = np.array([[80, 0, 0, 80], [0, 80, 80, 0], [80, 80, 0, 0]])
+
+    full = net.run(I_in)
+    first = np.where(full['firstSpike'] >= 0, full['firstSpike'], len(net.t))
+    decision.FirstSpike(net)
+    early = net.run(I_in)
+
+    if np.array_equal(early['winner'], np.argmin(first, axis=1)) and early['steps'] < len(net.t):
+        print(f"PASSED: First spike decision picks the first output to spike, after {early['steps']} steps")
+    else:
+        print(f"FAILED: First spike decision differs from the full phase")
+
+def checkpointMatch():
+    """
+        Make sure a network saved part way through a phase and loaded again finishes the phase like the original,
+        and that a weight of the memory mapped network can be set without touching the checkpoint
+    """
+    random.seed(41)
+    net = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=())
+    net.step(I_in=[30, 0, 50, 60], I_pain=10, steps=237)
+    with tempfile.TemporaryDirectory() as path:
+        checkpoint.save(net, path, state=True)
+        resumed = checkpoint.load(path, recordState=())
+        net.step(I_in=[30, 0, 50, 60], I_pain=10)
+        resumed.step(I_in=[30, 0, 50, 60], I_pain=10)
+
+        syn = resumed.projections[-1].synapse(0, 0)
+        saved = syn.weight
+        syn.weight = saved / 2
+        written = syn.weight == saved / 2 and checkpoint.load(path).projections[-1].synapse(0, 0).weight == saved
+
+    if written and all(np.array_equal(a.spikeCount, b.spikeCount) and np.array_equal(a.v, b.v)
+                       for a, b in zip(net.populations, resumed.populations)):
+        print(f"PASSED: Resumed checkpoint matches the uninterrupted network")
+    else:
+        print(f"FAILED: Resumed checkpoint differs from the uninterrupted network")
+
+def presetMatch():
+    """
+        Make sure layers mixing neuron presets give the same spike times in the vectorized (plain and gated) and the
+        Neuron-by-Neuron network
+    """
+    params = {'pain' : 'FS', 'hidden' : ['CH', 'IB', 'LTS'], 'output' : 'LTS'}
+    spikes = list()
+    for vectorized, gated in [(True, False), (True, True), (False, False)]:
+        random.seed(41)
+        net = Network(phaseDuration=50, dt=0.1, structure=[2, 1, 2, 3], vectorized=vectorized, gated=gated,
+                      recordSpikes=True, params=params)
+        net.step(I_in=[30, 20], I_pain=10)
+        spikes.append([[neu.spikeHistory for neu in layer] for layer in net.neurons])
+
+    if spikes[0] == spikes[1] == spikes[2]:
+        print(f"PASSED: Mixed neuron presets give the same spike times in every network")
+    else:
+        print(f"FAILED: Mixed neuron presets give different spike times")
+
+def rasterMatch():
+    """
+        Make sure a raster streamed to disk (in small chunks, then appended to) reloads with the recorded spikes,
+        per neuron and per time window
+    """
+    spikes = [(0, 3), (2, 3), (1, 7), (0, 9), (2, 12), (1, 15)]
+    with tempfile.TemporaryDirectory() as path:
+        file = os.path.join(path, 'raster.bin')
+        raster = RasterRecorder(3, path=file, chunkSize=2)
+        for id, step in spikes[:4]:
+            raster.record(np.array([id]), step)
+        raster.close()
+
+        # a second run appended to the file, counting its steps from 0 again
+        raster = RasterRecorder(3, path=file, chunkSize=2, append=True)
+        for id, step in spikes[4:]:
+            raster.record(np.array([id]), step - 10)
+        raster.close()
+        reloaded = RasterRecorder(3, path=file, append=True)
+
+        ok = (reloaded.ordered and len(reloaded) == len(spikes)
+              and [reloaded.spikes(i) for i in range(3)] == [[3, 9], [7, 15], [3, 12]]
+              and np.array_equal(reloaded.counts(), [2, 2, 2])
+              and [arr.tolist() for arr in reloaded.window(7, 13)] == [[1, 0, 2], [7, 9, 12]])
+        reloaded.close()
+
+        # a network streaming its spikes writes the last ones and closes the file on leaving the with block
+        random.seed(41)
+        file = os.path.join(path, 'network.bin')
+        with Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=(), recordSpikes=True,
+                     spikeFile=file) as net:
+            net.step(I_in=[30, 0, 50, 60], I_pain=0)
+            counts = net.raster.counts()
+        streamed = RasterRecorder(net.raster.size, path=file, append=True)
+        ok = ok and net.raster._file is None and np.array_equal(streamed.counts(), counts) and counts.sum() > 0
+        streamed.close()
+
+    if ok:
+        print(f"PASSED: Streamed raster reloads with every spike, by neuron and by window")
+    else:
+        print(f"FAILED: Streamed raster differs from the recorded spikes")
+
+def scheduleMatch():
+    """
+        Make sure two scheduled phases continue each other like one long phase, and that batches reset in place
+        repeat exactly
+    """
+    I_in = np.array([[80, 0, 0, 80], [0, 80, 80, 0], [80, 80, 0, 0]])
+    random.seed(41)
+    full = Network(phaseDuration=50, dt=0.1, structure=[4, 1, 3, 5], recordState=()).run(I_in, I_pain=10)['counts']
+
+    random.seed(41)
+    net = Network(phaseDuration=25, dt=0.1, structure=[4, 1, 3, 5], recordState=())
+    scheduler = schedule.PhaseScheduler(net, [schedule.Phase('first', pain=10), schedule.Phase('second', pain=10)])
+    phases = scheduler.run(I_in, batchSize=1)
+    again = scheduler.run(I_in, batchSize=1)
+
+    if np.array_equal(full, phases['first']['counts'] + phases['second']['counts']) and \
+            all(np.array_equal(phases[name]['counts'], again[name]['counts']) for name in phases):
+        print(f"PASSED: Scheduled phases match one long phase and repeat after in place resets")
+    else:
+        print(f"FAILED: Scheduled phases differ from one long phase or between runs")
+
+def sweepMatch():
+    """
+        Make sure a parallel sweep matches evaluating each configuration in this process, and that repeating it
+        only reads the cache
+    """
+    images = np.array([[1, 0, 0, 1], [0, 1, 1, 0], [1, 0, 1, 0], [0, 1, 0, 1], [1, 1, 0, 0], [0, 0, 1, 1]])
+    labels = np.array([1, 1, 2, 2, 3, 3])
+    configs = sweep.grid({'structure' : [4, 1, 3, 5], 'phaseDuration' : 30, 'ft' : [15, 35], 'maxI' : [60, 80]})
+    with tempfile.TemporaryDirectory() as path:
+        rows = sweep.sweep(configs, images=images, labels=labels, processes=2, cacheDir=path)
+        again = sweep.sweep(configs, images=images, labels=labels, processes=2, cacheDir=path)
+    serial = [sweep.evaluateConfig(config, images, labels)['meanSpikes'] for config in configs]
+
+    if [row['meanSpikes'] for row in rows] == serial and all(row['cached'] for row in again) and \
+            [row['meanSpikes'] for row in again] == serial:
+        print(f"PASSED: Parallel sweep matches serial evaluation and repeats from the cache")
+    else:
+        print(f"FAILED: Parallel sweep differs from serial evaluation or misses the cache")
+
 """ SYNAPSE TESTS """
 def synInit():
     test_pre_neu = Neuron(type=_INPUT)